@@ -0,0 +1,633 @@
+"""
+Нагрузочный тест бота без обращений к настоящим сервисам.
+
+Поднимает локальные заглушки API КиноПоиск и Bot API, прогоняет через диспетчер
+синтетические обновления от множества пользователей и выводит задержки
+(p50/p95/p99), пропускную способность и число запросов к внешним сервисам
+на одно действие пользователя.
+
+    python benchmark.py                                   # 500 пользователей по 3 действия
+    python benchmark.py --users 2000 --concurrency 200    # больше одновременных пользователей
+    python benchmark.py --api-latency 200 --api-error-rate 0.05
+    python benchmark.py --rate-limit                      # с лимитами отправки как в продакшене
+    python benchmark.py --json                            # результат одной строкой JSON для сравнения
+    python benchmark.py --serve-fakes                     # только запустить заглушки
+    python benchmark.py --startup                         # время запуска до первого обработанного обновления
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+TOKEN = "123456:benchmark"
+KINOPOISK_PATH = "/v1.4/movie"
+
+TITLES = [
+    "Матрица", "Интерстеллар", "Начало", "Крестный отец", "Бойцовский клуб", "Форрест Гамп",
+    "Зеленая миля", "Побег из Шоушенка", "Леон", "Титаник", "Аватар", "Джентльмены",
+    "Брат", "Ирония судьбы", "Москва слезам не верит", "Назад в будущее", "Терминатор", "Чужой",
+]
+GENRES = ["комедия", "драма", "ужасы", "фантастика", "боевик", "мультфильм"]
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """
+    Перцентиль по методу ближайшего ранга; values должны быть отсортированы.
+    """
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class FakeKinopoisk:
+    """
+    Заглушка API КиноПоиск: эндпоинты /movie и /movie/search с настраиваемыми
+    задержкой и долей ошибок, а также сервер постеров для HEAD-проверок.
+    Ответы детерминированы: одинаковые параметры дают одинаковые фильмы.
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, pages: int = 5, seed: int = 0) -> None:
+        """
+        :param latency: Средняя задержка ответа, в секундах (±50%).
+        :param error_rate: Доля ответов 500.
+        :param pages: Количество страниц в каждой выборке.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pages = pages
+        self.base_url = ""
+        self.calls: Counter = Counter()
+        self._random = random.Random(seed)
+
+    def app(self) -> web.Application:
+
+        app = web.Application()
+        app.router.add_get(KINOPOISK_PATH, self.handle_movie)
+        app.router.add_get(f"{KINOPOISK_PATH}/search", self.handle_search)
+        app.router.add_route("*", "/poster/{movie_id}.jpg", self.handle_poster)
+        return app
+
+    async def _delay(self) -> bool:
+
+        if self.latency:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+        return self._random.random() < self.error_rate
+
+    def _movies(self, seed: str, page: int, limit: int, name: Optional[str] = None) -> List[Dict[str, Any]]:
+
+        base = int(hashlib.md5(seed.encode()).hexdigest()[:6], 16)
+        docs = []
+        for i in range(limit):
+            movie_id = base * 100 + (page - 1) * limit + i
+            docs.append({
+                "id": movie_id,
+                "name": f"{name or 'Фильм'} {movie_id % 1000}" if i else (name or f"Фильм {movie_id}"),
+                "description": "Описание фильма для нагрузочного теста. " * 5,
+                "rating": {"imdb": round(5 + (movie_id % 50) / 10, 1)},
+                "year": 1950 + movie_id % 75,
+                "genres": [{"name": GENRES[movie_id % len(GENRES)]}],
+                "ageRating": 16,
+                "poster": {"url": f"{self.base_url}/poster/{movie_id}.jpg"},
+                "budget": {"value": 1000000 * (movie_id % 200)},
+            })
+        return docs
+
+    def _page(self, request: web.Request, name: Optional[str] = None) -> Dict[str, Any]:
+
+        page = int(request.query.get("page", 1))
+        limit = int(request.query.get("limit", 10))
+        seed = "&".join(
+            f"{key}={value}" for key, value in sorted(request.query.items()) if key not in ("page", "selectFields")
+        )
+        docs = self._movies(seed, page, limit, name)
+        # Как и настоящий API, отдает только запрошенные в selectFields поля
+        fields = request.query.getall("selectFields", [])
+        if fields:
+            docs = [{field: doc[field] for field in fields if field in doc} for doc in docs]
+        return {
+            "docs": docs,
+            "total": self.pages * limit,
+            "limit": limit,
+            "page": page,
+            "pages": self.pages,
+        }
+
+    async def handle_movie(self, request: web.Request) -> web.Response:
+
+        self.calls["/movie"] += 1
+        if await self._delay():
+            return web.json_response({"message": "Internal Server Error"}, status=500)
+        return web.json_response(self._page(request))
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+
+        self.calls["/search"] += 1
+        if await self._delay():
+            return web.json_response({"message": "Internal Server Error"}, status=500)
+        return web.json_response(self._page(request, name=request.query.get("query")))
+
+    async def handle_poster(self, request: web.Request) -> web.Response:
+
+        self.calls["poster"] += 1
+        # Каждый десятый постер недоступен
+        if int(request.match_info["movie_id"]) % 10 == 0:
+            return web.Response(status=404)
+        return web.Response(body=b"", content_type="image/jpeg")
+
+
+class FakeTelegram:
+    """
+    Заглушка Bot API: принимает любой метод, отвечает правдоподобными объектами
+    и считает вызовы по методам.
+    """
+
+    def __init__(self, latency: float = 0.02, seed: int = 0) -> None:
+        """
+        :param latency: Средняя задержка ответа, в секундах (±50%).
+        """
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        self._random = random.Random(seed)
+
+    def app(self) -> web.Application:
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    def _message(self, chat_id: Any, photo: bool = False) -> Dict[str, Any]:
+
+        message_id = next(self._message_ids)
+        message: Dict[str, Any] = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+        }
+        if photo:
+            message["photo"] = [{"file_id": f"photo{message_id}", "file_unique_id": f"u{message_id}", "width": 1, "height": 1}]
+        else:
+            message["text"] = "ok"
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        fields = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+
+        chat_id = fields.get("chat_id")
+        normalized = method.lower()
+        if normalized == "sendmediagroup":
+            media = json.loads(fields.get("media") or "[]")
+            result: Any = [self._message(chat_id, photo=True) for _ in media]
+        elif normalized == "sendphoto":
+            result = self._message(chat_id, photo=True)
+        elif normalized in ("sendmessage", "editmessagetext"):
+            result = self._message(chat_id)
+        elif normalized == "getme":
+            result = {"id": 123456, "is_bot": True, "first_name": "benchmark", "username": "benchmark_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+async def start_app(app: web.Application, port: int = 0) -> Tuple[web.AppRunner, int]:
+    """
+    Запускает приложение на 127.0.0.1 и возвращает сервер и фактический порт.
+    """
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+class UpdateFactory:
+    """
+    Строит синтетические обновления: сообщения и нажатия кнопок от пользователей.
+    """
+
+    def __init__(self) -> None:
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _chat_message(self, user_id: int, text: Optional[str] = None) -> Dict[str, Any]:
+
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def message(self, user_id: int, text: str) -> Dict[str, Any]:
+
+        return {"update_id": next(self._update_ids), "message": self._chat_message(user_id, text)}
+
+    def callback(self, user_id: int, data: str) -> Dict[str, Any]:
+
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "message": self._chat_message(user_id, "menu"),
+                "data": data,
+            },
+        }
+
+
+# Действия пользователя: последовательность обновлений, которые он отправляет
+Scenario = Callable[[UpdateFactory, int, random.Random], List[Dict[str, Any]]]
+
+def _today() -> str:
+    return datetime.now().strftime("%d-%m-%Y")
+
+SCENARIOS: Dict[str, Scenario] = {
+    "title": lambda f, user, rnd: [f.callback(user, "movie_search"), f.message(user, rnd.choice(TITLES))],
+    "rating": lambda f, user, rnd: [f.callback(user, "movie_by_rating"), f.message(user, f"{rnd.randint(5, 7)}-9")],
+    "genre": lambda f, user, rnd: [f.callback(user, "movie_by_genre"), f.callback(user, f"genre:{rnd.choice(GENRES)}")],
+    "budget": lambda f, user, rnd: [f.callback(user, rnd.choice(["low_budget_movie", "high_budget_movie"]))],
+    "year_refresh": lambda f, user, rnd: [
+        f.callback(user, "movie_by_year"), f.message(user, str(rnd.randint(1980, 2020))), f.callback(user, "refresh")
+    ],
+    "history": lambda f, user, rnd: [
+        f.callback(user, "history"), f.message(user, _today()), f.callback(user, f"hist:{_today()}:1")
+    ],
+}
+
+
+def configure_environment(workdir: str, kinopoisk_url: str, telegram_url: str, rate_limit: bool) -> None:
+    """
+    Настраивает бота на заглушки и временные базы. Вызывается до импорта bot,
+    потому что config читает переменные окружения при импорте.
+    """
+    os.environ.update({
+        "TELEGRAM_TOKEN": TOKEN,
+        "KINOPOISK_API_KEY": "benchmark",
+        "KINOPOISK_API_KEYS": "benchmark",
+        "KINOPOISK_BASE_URL": kinopoisk_url,
+        "TELEGRAM_API_SERVER": telegram_url,
+        "HISTORY_DB_PATH": os.path.join(workdir, "history.db"),
+        "FSM_DB_PATH": os.path.join(workdir, "fsm.db"),
+        "CATALOG_DB_PATH": os.path.join(workdir, "catalog.db"),
+        "KINOPOISK_KEYS_DB_PATH": os.path.join(workdir, "keys.db"),
+        "KINOPOISK_KEY_DAILY_LIMIT": "0",
+        "FSM_REDIS_URL": "",
+        "CACHE_DB_PATH": "",
+        "METRICS_PORT": "0",
+        "DIGEST_DB_PATH": os.path.join(workdir, "digest.db"),
+        "DIGEST_HOUR": "-1",
+    })
+    if not rate_limit:
+        os.environ.update({
+            "TELEGRAM_GLOBAL_RATE": "1000000",
+            "TELEGRAM_CHAT_RATE": "1000000",
+            "TELEGRAM_CHAT_BURST": "1000000",
+            "TELEGRAM_GROUP_RATE": "1000000",
+            "TELEGRAM_GROUP_BURST": "1000000",
+        })
+
+
+async def drive(
+    users: int,
+    actions: int,
+    concurrency: int,
+    seed: int,
+) -> Dict[str, Any]:
+    """
+    Прогоняет действия пользователей через диспетчер и собирает задержки.
+    Действия одного пользователя выполняются последовательно, пользователи - параллельно.
+    """
+    from aiogram.types import Update
+    from bot import bot, dp
+
+    factory = UpdateFactory()
+    rnd = random.Random(seed)
+    plan = [
+        [(name, SCENARIOS[name](factory, 100000 + user, rnd)) for name in rnd.choices(list(SCENARIOS), k=actions)]
+        for user in range(users)
+    ]
+
+    latencies: List[float] = []
+    by_scenario: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_user(user_plan: List[Tuple[str, List[Dict[str, Any]]]]) -> None:
+        nonlocal errors
+        async with semaphore:
+            for name, updates in user_plan:
+                action_started = time.perf_counter()
+                for raw in updates:
+                    update = Update.model_validate(raw, context={"bot": bot})
+                    started = time.perf_counter()
+                    try:
+                        await dp.feed_update(bot, update)
+                    except Exception:
+                        errors += 1
+                    latencies.append(time.perf_counter() - started)
+                by_scenario[name].append(time.perf_counter() - action_started)
+
+    await dp.emit_startup()
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(user_plan) for user_plan in plan))
+    elapsed = time.perf_counter() - started
+    await dp.emit_shutdown()
+
+    return {
+        "elapsed": elapsed,
+        "updates": len(latencies),
+        "actions": users * actions,
+        "errors": errors,
+        "latencies": sorted(latencies),
+        "by_scenario": {name: sorted(values) for name, values in by_scenario.items()},
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+
+    kinopoisk = FakeKinopoisk(latency=args.api_latency / 1000, error_rate=args.api_error_rate, seed=args.seed)
+    telegram = FakeTelegram(latency=args.telegram_latency / 1000, seed=args.seed)
+    kinopoisk_runner, kinopoisk_port = await start_app(kinopoisk.app())
+    telegram_runner, telegram_port = await start_app(telegram.app())
+    kinopoisk.base_url = f"http://127.0.0.1:{kinopoisk_port}"
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            # history_manager переносит history.json из текущего каталога: рабочая история не должна попасть в тест
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                configure_environment(
+                    workdir,
+                    f"{kinopoisk.base_url}{KINOPOISK_PATH}",
+                    f"http://127.0.0.1:{telegram_port}",
+                    args.rate_limit,
+                )
+                result = await drive(args.users, args.actions, args.concurrency, args.seed)
+                from history_manager import close_connection
+                close_connection()
+            finally:
+                os.chdir(cwd)
+    finally:
+        await kinopoisk_runner.cleanup()
+        await telegram_runner.cleanup()
+
+    latencies = result["latencies"]
+    actions = result["actions"]
+    api_calls = kinopoisk.calls["/movie"] + kinopoisk.calls["/search"]
+    telegram_calls = sum(telegram.calls.values())
+    return {
+        "users": args.users,
+        "actions": actions,
+        "updates": result["updates"],
+        "errors": result["errors"],
+        "elapsed_s": round(result["elapsed"], 3),
+        "updates_per_s": round(result["updates"] / result["elapsed"], 1),
+        "telegram_calls_per_s": round(telegram_calls / result["elapsed"], 1),
+        "latency_ms": {
+            f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)
+        },
+        "action_p95_ms": {
+            name: round(percentile(values, 95) * 1000, 2) for name, values in sorted(result["by_scenario"].items())
+        },
+        "api_calls_per_action": round(api_calls / actions, 3),
+        "poster_checks_per_action": round(kinopoisk.calls["poster"] / actions, 3),
+        "telegram_calls_per_action": round(telegram_calls / actions, 3),
+        "telegram_calls": dict(telegram.calls.most_common()),
+    }
+
+
+# Процесс, который замеряет запуск бота: импортирует только бота, чтобы заглушки
+# и модули теста не попали в замер времени импорта
+_STARTUP_PROBE = """
+import time
+started = time.time()
+import bot
+imported = time.time()
+import asyncio
+import json
+from aiogram.types import Update
+
+async def watch_loop(stall, handling):
+    # Самые долгие паузы цикла событий: столько ждало бы обновление, пришедшее во время прогрева.
+    # Паузы, пока обрабатываются обновления замера, учитываются отдельно от прогрева
+    while True:
+        tick = time.perf_counter()
+        busy = handling[0]
+        await asyncio.sleep(0.001)
+        name = "updates" if busy or handling[0] else "warmup"
+        stall[name] = max(stall[name], time.perf_counter() - tick - 0.001)
+
+async def probe():
+    user = {"id": 1, "is_bot": False, "first_name": "user"}
+    message = {"message_id": 1, "date": int(started), "chat": {"id": 1, "type": "private"}, "from": user}
+    updates = [
+        {"update_id": 1, "message": {**message, "text": "/start"}},
+        {"update_id": 2, "callback_query": {
+            "id": "2", "from": user, "chat_instance": "1", "message": message, "data": "low_budget_movie"
+        }},
+    ]
+    await bot.dp.emit_startup()
+    stamps = {"started": started, "imported": imported, "startup": time.time()}
+    stall = {"warmup": 0.0, "updates": 0.0}
+    handling = [False]
+    watcher = asyncio.create_task(watch_loop(stall, handling))
+    for name, raw in zip(("first_update", "first_search"), updates):
+        handling[0] = True
+        await bot.dp.feed_update(bot.bot, Update.model_validate(raw, context={"bot": bot.bot}))
+        handling[0] = False
+        stamps[name] = time.time()
+    if bot.warmup_task is not None:
+        await bot.warmup_task
+    stamps["warmed_up"] = time.time()
+    watcher.cancel()
+    await bot.dp.emit_shutdown()
+    print(json.dumps({"stamps": stamps, "warmup": bot.warmup_timings, "stall": stall}))
+
+asyncio.run(probe())
+"""
+
+
+def import_profile(stderr: str, limit: int = 10) -> List[Tuple[str, float]]:
+    """
+    Модули, которые импортирует bot, по суммарному времени импорта из вывода -X importtime.
+    """
+    modules: List[Tuple[str, float]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Один отступ - модули, импортированные замером, три - импортированные ими
+        if name.startswith("   ") and not name.startswith("    "):
+            modules.append((name.strip(), int(cumulative) / 1000))
+        elif name.strip() == "bot":
+            return sorted(modules, key=lambda module: module[1], reverse=True)[:limit]
+        elif not name.startswith("  "):
+            modules = []
+    return []
+
+
+async def run_startup_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Запускает бота в отдельном процессе и замеряет время до первого обработанного
+    обновления: запуск интерпретатора, импорт, запуск диспетчера, первый ответ,
+    первый поиск и завершение фонового прогрева.
+    """
+    kinopoisk = FakeKinopoisk(latency=args.api_latency / 1000, seed=args.seed)
+    telegram = FakeTelegram(latency=args.telegram_latency / 1000, seed=args.seed)
+    kinopoisk_runner, kinopoisk_port = await start_app(kinopoisk.app())
+    telegram_runner, telegram_port = await start_app(telegram.app())
+    kinopoisk.base_url = f"http://127.0.0.1:{kinopoisk_port}"
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            configure_environment(
+                workdir,
+                f"{kinopoisk.base_url}{KINOPOISK_PATH}",
+                f"http://127.0.0.1:{telegram_port}",
+                args.rate_limit,
+            )
+            env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+            spawned = time.time()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-X", "importtime", "-c", _STARTUP_PROBE,
+                cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+            stdout, stderr = await process.communicate()
+    finally:
+        await kinopoisk_runner.cleanup()
+        await telegram_runner.cleanup()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Процесс замера завершился с ошибкой:\n{stderr.decode()[-2000:]}")
+    result = json.loads(stdout.decode().strip().splitlines()[-1])
+    stamps = result["stamps"]
+
+    def since(start: float, end: str) -> float:
+        return round((stamps[end] - start) * 1000, 1)
+
+    return {
+        "interpreter_ms": since(spawned, "started"),
+        "import_ms": since(stamps["started"], "imported"),
+        "startup_ms": since(stamps["imported"], "startup"),
+        "first_update_ms": since(stamps["startup"], "first_update"),
+        "first_search_ms": since(stamps["first_update"], "first_search"),
+        "time_to_first_update_ms": since(spawned, "first_update"),
+        "time_to_warm_ms": since(spawned, "warmed_up"),
+        "warmup_ms": {name: round(seconds * 1000, 1) for name, seconds in result["warmup"].items()},
+        "loop_stall_ms": {name: round(seconds * 1000, 1) for name, seconds in result["stall"].items()},
+        "imports_ms": dict(import_profile(stderr.decode())),
+    }
+
+
+def print_startup_report(report: Dict[str, Any]) -> None:
+
+    print(f"Время до первого обработанного обновления: {report['time_to_first_update_ms']} мс")
+    print(
+        f"Запуск интерпретатора {report['interpreter_ms']} мс, импорт бота {report['import_ms']} мс, "
+        f"запуск диспетчера {report['startup_ms']} мс, первое обновление {report['first_update_ms']} мс, "
+        f"первый поиск {report['first_search_ms']} мс"
+    )
+    print(f"Прогрев завершен через {report['time_to_warm_ms']} мс после запуска процесса")
+    if report["warmup_ms"]:
+        print("Шаги прогрева, мс: " + ", ".join(f"{name} {value}" for name, value in report["warmup_ms"].items()))
+    stall = report["loop_stall_ms"]
+    print(
+        f"Самая долгая блокировка цикла событий: прогревом {stall['warmup']} мс, "
+        f"обработкой обновлений замера {stall['updates']} мс"
+    )
+    print("Импорт модулей, мс: " + ", ".join(f"{name} {value}" for name, value in report["imports_ms"].items()))
+
+
+def print_report(report: Dict[str, Any]) -> None:
+
+    latency = report["latency_ms"]
+    print(f"Пользователей: {report['users']}, действий: {report['actions']}, обновлений: {report['updates']}, ошибок: {report['errors']}")
+    print(f"Время: {report['elapsed_s']} с, обновлений/с: {report['updates_per_s']}, запросов к Bot API/с: {report['telegram_calls_per_s']}")
+    print(f"Задержка обновления, мс: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}")
+    print("Задержка действия p95, мс: " + ", ".join(f"{name} {value}" for name, value in report["action_p95_ms"].items()))
+    print(
+        f"На действие: запросов к API {report['api_calls_per_action']}, "
+        f"проверок постеров {report['poster_checks_per_action']}, "
+        f"запросов к Bot API {report['telegram_calls_per_action']}"
+    )
+    print("Методы Bot API: " + ", ".join(f"{name} {count}" for name, count in report["telegram_calls"].items()))
+
+
+async def serve_fakes(args: argparse.Namespace) -> None:
+
+    kinopoisk = FakeKinopoisk(latency=args.api_latency / 1000, error_rate=args.api_error_rate, seed=args.seed)
+    telegram = FakeTelegram(latency=args.telegram_latency / 1000, seed=args.seed)
+    _, kinopoisk_port = await start_app(kinopoisk.app(), args.kinopoisk_port)
+    _, telegram_port = await start_app(telegram.app(), args.telegram_port)
+    kinopoisk.base_url = f"http://127.0.0.1:{kinopoisk_port}"
+    print(f"KINOPOISK_BASE_URL={kinopoisk.base_url}{KINOPOISK_PATH}")
+    print(f"TELEGRAM_API_SERVER=http://127.0.0.1:{telegram_port}")
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальных заглушках")
+    parser.add_argument("--users", type=int, default=500, help="количество пользователей")
+    parser.add_argument("--actions", type=int, default=3, help="действий на пользователя")
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременно активных пользователей")
+    parser.add_argument("--api-latency", type=float, default=50, help="задержка API КиноПоиск, мс")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="доля ошибок API КиноПоиск")
+    parser.add_argument("--telegram-latency", type=float, default=20, help="задержка Bot API, мс")
+    parser.add_argument("--rate-limit", action="store_true", help="оставить лимиты отправки из конфигурации")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    parser.add_argument("--serve-fakes", action="store_true", help="только запустить заглушки")
+    parser.add_argument("--startup", action="store_true", help="замерить запуск бота вместо нагрузки")
+    parser.add_argument("--kinopoisk-port", type=int, default=8081, help="порт заглушки КиноПоиска для --serve-fakes")
+    parser.add_argument("--telegram-port", type=int, default=8082, help="порт заглушки Bot API для --serve-fakes")
+    args = parser.parse_args()
+
+    if args.serve_fakes:
+        asyncio.run(serve_fakes(args))
+        return
+    if args.startup:
+        report = asyncio.run(run_startup_benchmark(args))
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False))
+        else:
+            print_startup_report(report)
+        return
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,38 @@
 import asyncio
-import aiohttp
+import logging
+import time
 from datetime import datetime
-from typing import Callable, Dict, Any, Optional
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
 
 from aiogram import Bot, Dispatcher
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, InputMediaPhoto
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup, InlineKeyboardButton
 
-from config import TELEGRAM_TOKEN
+from config import (
+    TELEGRAM_TOKEN,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_GROUP_RATE,
+    TELEGRAM_GROUP_BURST,
+    TELEGRAM_SEND_RETRIES,
+    TELEGRAM_API_SERVER,
+    PREFETCH_TTL,
+    PREFETCH_MAX_USERS,
+    PREFETCH_BUDGET_PER_MINUTE,
+    PREFETCH_MAX_CONCURRENT,
+    SEARCH_MAX_CONCURRENT,
+    METRICS_HOST,
+    METRICS_PORT,
+    LOG_LEVEL,
+    WARMUP_ENABLED,
+    DIGEST_HOUR,
+)
 from kinopoisk_api import (
     search_movies,
     movie_by_rating,
@@ -19,20 +40,116 @@ from kinopoisk_api import (
     search_high_budget_movies,
     search_movies_by_year,
     search_movies_by_genre,
+    close_session,
+    response_cache,
+    breaker,
+    get_key_pool,
+    warm_up as warm_up_kinopoisk,
 )
 from history_manager import (
-    add_to_history,
+    add_many_to_history,
+    count_history_by_date,
     get_history_by_date,
-    mark_movie_as_watched,    
+    mark_movie_as_watched,
+    start_writer as start_history_writer,
+    stop_writer as stop_history_writer,
+    writer_stats as history_writer_stats,
+    close_connection as close_history,
+    get_connection as open_history,
+)
+from posters import (
+    resolve_poster,
+    resolve_posters,
+    remember_file_id,
+    poster_cache,
+    close_session as close_poster_session,
+    warm_up as warm_up_posters,
+)
+from send_queue import SendScheduler, RateLimitMiddleware
+from fsm_storage import create_storage
+from genres import normalize_genre
+from prefetch import Prefetcher
+from search_scheduler import SearchScheduler
+from title_index import title_index
+from movies import Movie
+from digest import digest_scheduler, get_store as get_digest_store
+from recommend import recommend_movies, recommender
+from render import (
+    CAPTION_LIMIT,
+    card_cache,
+    format_history_entry,
+    format_movie_card,
+    get_genre_menu,
+    get_history_buttons,
+    get_main_menu,
 )
+from metrics import HandlerMetricsMiddleware, RequestMetricsMiddleware, registry, start_metrics_server
+
+logger = logging.getLogger(__name__)
 
 # Создаем объект бота и диспетчер
-bot = Bot(token=TELEGRAM_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+bot = Bot(
+    token=TELEGRAM_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER)) if TELEGRAM_API_SERVER else None
+)
+dp = Dispatcher(storage=create_storage())
+
+# Все исходящие запросы к чатам проходят через общую очередь с ограничением частоты
+send_scheduler = SendScheduler(
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    chat_rate=TELEGRAM_CHAT_RATE,
+    chat_burst=TELEGRAM_CHAT_BURST,
+    group_rate=TELEGRAM_GROUP_RATE,
+    group_burst=TELEGRAM_GROUP_BURST,
+)
+bot.session.middleware(RateLimitMiddleware(send_scheduler, max_retries=TELEGRAM_SEND_RETRIES))
+bot.session.middleware(RequestMetricsMiddleware())
+
+# Время работы обработчиков
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+
+# Следующие страницы для кнопки "Обновить"
+prefetcher = Prefetcher(
+    ttl=PREFETCH_TTL,
+    max_users=PREFETCH_MAX_USERS,
+    budget_per_minute=PREFETCH_BUDGET_PER_MINUTE,
+    max_concurrent=PREFETCH_MAX_CONCURRENT,
+)
+
+# Очередь поисков с честным распределением между чатами
+search_scheduler = SearchScheduler(max_concurrent=SEARCH_MAX_CONCURRENT)
+
+# Текущие показатели кэшей и очередей для /metrics
+registry.register_stats("response_cache", "Кэш ответов API", response_cache.stats)
+registry.register_stats("kinopoisk_breaker", "Размыкатель запросов к API КиноПоиск", breaker.stats)
+registry.register_stats("kinopoisk_keys", "Пул ключей API КиноПоиск", lambda: get_key_pool().stats())
+registry.register_stats("poster_cache", "Кэш постеров", poster_cache.stats)
+registry.register_stats("prefetch", "Предзагрузка страниц", prefetcher.stats)
+registry.register_stats("send_queue", "Очередь отправки сообщений", send_scheduler.stats)
+registry.register_stats("history_writer", "Отложенная запись истории", history_writer_stats)
+registry.register_stats("search_queue", "Очередь поисков", search_scheduler.stats)
+registry.register_stats("render_cache", "Кэш карточек фильмов", card_cache.stats)
+registry.register_stats("recommendations", "Рекомендации по просмотренным фильмам", recommender.stats)
+registry.register_stats("warmup", "Длительность шагов прогрева после запуска, с", lambda: warmup_timings)
 
 # Константы
 LIMIT = 5
 
+# Функции поиска по имени: в состоянии FSM хранится имя и параметры запроса, а не сама функция
+SEARCH_FUNCTIONS: Dict[str, Callable[..., Awaitable[Dict[str, Any]]]] = {
+    function.__name__: function
+    for function in (
+        search_movies,
+        movie_by_rating,
+        search_low_budget_movies,
+        search_high_budget_movies,
+        search_movies_by_year,
+        search_movies_by_genre,
+        recommend_movies,
+    )
+}
+
 # Определение состояний
 class SearchState(StatesGroup):
     waiting_for_movie_title = State()
@@ -41,20 +158,6 @@ class SearchState(StatesGroup):
     waiting_for_genre = State()
     waiting_for_history_date = State()
 
-def get_main_menu() -> InlineKeyboardMarkup:
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(text="Найти фильм по названию", callback_data="movie_search")
-    builder.button(text="Найти фильм по рейтингу", callback_data="movie_by_rating")
-    builder.button(text="Найти фильмы с низким бюджетом", callback_data="low_budget_movie")
-    builder.button(text="Найти фильмы с высоким бюджетом", callback_data="high_budget_movie")
-    builder.button(text="Найти фильм по году выпуска", callback_data="movie_by_year")
-    builder.button(text="Найти фильм по жанру", callback_data="movie_by_genre")
-    builder.button(text="История запросов", callback_data="history")
-    builder.button(text="Обновить", callback_data="refresh")
-    builder.adjust(1)
-    return builder.as_markup()
-
 @dp.message(Command(commands=['start', 'help']))
 async def send_welcome(message: Message) -> None:
     
@@ -66,7 +169,7 @@ async def send_welcome(message: Message) -> None:
 @dp.callback_query(lambda c: c.data in [
     "movie_search", "movie_by_rating", "low_budget_movie",
     "high_budget_movie", "movie_by_year", "movie_by_genre",
-    "history", "refresh"
+    "history", "recommend", "refresh"
 ])
 async def handle_menu_callbacks(callback_query: CallbackQuery, state: FSMContext) -> None:
     """
@@ -91,16 +194,13 @@ async def handle_menu_callbacks(callback_query: CallbackQuery, state: FSMContext
         await callback_query.message.answer("Введите год выпуска фильма (или диапазон в формате: от-до):")
         await state.set_state(SearchState.waiting_for_year)
     elif data == "movie_by_genre":
-        await callback_query.message.answer(
-            "Введите жанр фильма. Доступные жанры: Комедии, Мультфильмы, Ужасы, Фантастика, Триллеры, Боевики, Мелодрамы, "
-            "Детективы, Приключения, Фэнтези, Военные, Семейные, Аниме, Исторические, Драмы, Документальные, Детские, "
-            "Криминал, Биографии, Вестерны, Фильмы-нуар, Спортивные, Реальное ТВ, Короткометражки, Музыкальные, Мюзиклы, "
-            "Ток-шоу, Игры."
-        )
+        await callback_query.message.answer("Выберите жанр или введите его:", reply_markup=get_genre_menu())
         await state.set_state(SearchState.waiting_for_genre)
     elif data == "history":
         await callback_query.message.answer("Введите дату для просмотра истории в формате ДД-ММ-ГГГГ:")
         await state.set_state(SearchState.waiting_for_history_date)
+    elif data == "recommend":
+        await show_recommendations(callback_query.message, state)
     elif data == "refresh":
         await refresh_search(callback_query.message, state)
 
@@ -128,60 +228,81 @@ async def rating_search_prompt(message: Message, state: FSMContext) -> None:
     await message.answer("Введите диапазон рейтинга в формате: от-до (например, 7-9.5):")
     await state.set_state(SearchState.waiting_for_rating_range)
 
-async def search_and_send_movies(message: Message, search_function: Callable[..., Dict[str, Any]], **kwargs: Any) -> None:
+async def send_movie_page(message: Message, movies: List[Movie]) -> None:
+    """
+    Отправляет страницу результатов: постеры проверяются параллельно,
+    фильмы с постерами уходят одной медиагруппой с подписями, остальные - текстом.
+
+    Args:
+        message (Message): Сообщение, в чат которого отправляются результаты.
+        movies (List[Movie]): Фильмы страницы.
+    """
+    posters = await resolve_posters([(movie.id, movie.poster) for movie in movies])
+
+    with_poster = [(movie, poster) for movie, poster in zip(movies, posters) if poster]
+    without_poster = [movie for movie, poster in zip(movies, posters) if not poster]
+    media = [
+        InputMediaPhoto(media=poster, caption=format_movie_card(movie, CAPTION_LIMIT), parse_mode='Markdown')
+        for movie, poster in with_poster
+    ]
+
+    try:
+        if len(media) > 1:
+            sent = await bot.send_media_group(message.chat.id, media=media)
+        elif media:
+            sent = [await bot.send_photo(message.chat.id, media[0].media, caption=media[0].caption, parse_mode='Markdown')]
+        else:
+            sent = []
+    except Exception as e:
+        await message.answer(f"Ошибка при отправке изображения: {str(e)}")
+        without_poster = movies
+        sent = []
+
+    # Повторные отправки этих постеров пойдут по file_id без скачивания изображения Telegram
+    for (movie, _), sent_message in zip(with_poster, sent):
+        if sent_message.photo:
+            remember_file_id(movie.id, movie.poster, sent_message.photo[-1].file_id)
+
+    for movie in without_poster:
+        await message.answer(format_movie_card(movie), parse_mode='Markdown')
+
+async def search_and_send_movies(message: Message, search_function: Callable[..., Awaitable[Dict[str, Any]]], **kwargs: Any) -> None:
+    """
+    Выполняет поиск через планировщик: не больше одного поиска на чат, новый запрос
+    заменяет еще не начатый, общий лимит одновременных поисков делится между чатами по очереди.
+    """
+    await search_scheduler.run(
+        message.chat.id,
+        lambda: _search_and_send_movies(message, search_function, **kwargs)
+    )
+
+async def _search_and_send_movies(message: Message, search_function: Callable[..., Awaitable[Dict[str, Any]]], **kwargs: Any) -> None:
     
     state = kwargs.pop('state', None)
-    movies = search_function(**kwargs)
+    name = search_function.__name__
+    movies = await prefetcher.take(message.chat.id, name, kwargs) or await search_function(**kwargs)
 
     if 'error' in movies:
         await message.answer(movies['error'])
     else:
-        if movies.get('docs'):
-            for movie in movies['docs']:
-                movie_id = movie.get('id')
-                title = movie.get('name')
-                if not title:
-                    continue
-
-                movie_info = (
-                    f"*Название:* {title}\n"
-                    f"*Описание:* {movie.get('description', 'Нет описания')}\n"
-                    f"*Рейтинг IMDb:* {movie.get('rating', {}).get('imdb', 'Нет рейтинга')}\n"
-                    f"*Год:* {movie.get('year', 'Неизвестно')}\n"
-                    f"*Жанр:* {', '.join([g['name'] for g in movie.get('genres', [])])}\n"
-                    f"*Возрастной рейтинг:* {movie.get('ageRating', 'N/A')}\n"
-                )
-                poster_url = movie.get('poster', {}).get('url')
-
-                if poster_url:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.head(poster_url) as response:
-                            if response.status == 200 and 'image' in response.headers.get('Content-Type', ''):
-                                try:
-                                    await bot.send_photo(message.chat.id, poster_url, caption="", parse_mode='Markdown')
-                                except Exception as e:
-                                    await message.answer(f"Ошибка при отправке изображения: {str(e)}")
-                            else:
-                                await message.answer("Не удалось загрузить изображение.")
-
-                await message.answer(movie_info, parse_mode='Markdown')
-
-                # Добавление информации о фильме в историю
-                add_to_history({
-                    "id": movie_id,
-                    "date": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
-                    "title": title,
-                    "description": movie.get('description', 'Нет описания'),
-                    "rating": movie.get('rating', {}).get('imdb', 'Нет рейтинга'),
-                    "year": movie.get('year', 'Неизвестно'),
-                    "genre": ', '.join([g['name'] for g in movie.get('genres', [])]),
-                    "age_rating": movie.get('ageRating', 'N/A'),
-                    "poster": poster_url,
-                    "watched": False
-                })
+        if movies.get('source'):
+            # Следующие страницы берутся из того же источника, что и эта
+            kwargs = {**kwargs, 'source': movies['source']}
+        page = [movie for movie in movies.get('docs') or [] if movie.name]
+        if page:
+            # Следующая страница загружается, пока отправляется текущая
+            if state and kwargs.get('page', 1) < movies.get('pages', 0):
+                next_kwargs = {**kwargs, 'page': kwargs.get('page', 1) + 1}
+                prefetcher.schedule(message.chat.id, name, next_kwargs, lambda: search_function(**next_kwargs))
+
+            await send_movie_page(message, page)
+
+            # Добавление информации о фильмах в историю
+            date = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+            add_many_to_history(message.chat.id, [movie.to_history_entry(date) for movie in page])
 
             if state:
-                await state.update_data(search_function=search_function, kwargs=kwargs)
+                await state.update_data(query={"name": name, "kwargs": kwargs})
             await message.answer("Чтобы обновить результаты, нажмите кнопку 'Обновить'.")
         else:
             await message.answer("По вашему запросу фильмов не найдено.")
@@ -203,15 +324,67 @@ async def movie_by_year_prompt(message: Message, state: FSMContext) -> None:
     await message.answer("Введите год выпуска фильма (или диапазон в формате: от-до):")
     await state.set_state(SearchState.waiting_for_year)
 
+@dp.message(Command(commands=['recommend']))
+async def show_recommendations(message: Message, state: FSMContext) -> None:
+    """
+    Показывает фильмы, похожие на отмеченные просмотренными, без запросов к API.
+    """
+    await search_and_send_movies(message, recommend_movies, user_id=message.chat.id, limit=LIMIT, page=1, state=state)
+
+@dp.message(Command(commands=['digest']))
+async def digest_subscription(message: Message, command: CommandObject) -> None:
+    """
+    Подписка на ежедневную подборку новинок: /digest - жанры по истории просмотров,
+    /digest драма, комедия - заданные жанры, /digest off - отписка.
+    """
+    args = (command.args or "").strip()
+    store = get_digest_store()
+    if args.casefold() in ("off", "стоп"):
+        if store.unsubscribe(message.chat.id):
+            await message.answer("Подписка на подборку новинок отменена.")
+        else:
+            await message.answer("Вы не подписаны на подборку новинок.")
+        return
+
+    names = [name.strip() for name in args.split(",") if name.strip()]
+    genres = [normalize_genre(name) for name in names]
+    unknown = [name for name, genre in zip(names, genres) if genre is None]
+    if unknown:
+        await message.answer(f"Не удалось распознать жанры: {', '.join(unknown)}. Перечислите жанры через запятую.")
+        return
+    store.subscribe(message.chat.id, genres)
+    if genres:
+        await message.answer(f"Вы подписаны на подборку новинок в жанрах: {', '.join(genres)}.")
+    else:
+        await message.answer(
+            "Вы подписаны на подборку новинок. Жанры выбираются по фильмам, отмеченным в истории как просмотренные."
+        )
+
 @dp.message(Command(commands=['movie_by_genre']))
 async def movie_by_genre_prompt(message: Message, state: FSMContext) -> None:
     
-    await message.answer("Введите жанр фильма. Доступные жанры: Комедии, Мультфильмы, Ужасы, Фантастика, Триллеры, Боевики, "
-                         "Мелодрамы, Детективы, Приключения, Фэнтези, Военные, Семейные, Аниме, Исторические, Драмы, "
-                         "Документальные, Детские, Криминал, Биографии, Вестерны, Фильмы-нуар, Спортивные, Реальное ТВ, "
-                         "Короткометражки, Музыкальные, Мюзиклы, Ток-шоу, Игры.")
+    await message.answer("Выберите жанр или введите его:", reply_markup=get_genre_menu())
     await state.set_state(SearchState.waiting_for_genre)
 
+@dp.callback_query(lambda c: c.data.startswith("genre:"))
+async def genre_selected(callback_query: CallbackQuery, state: FSMContext) -> None:
+    
+    genre = normalize_genre(callback_query.data.split(":", 1)[1])
+    await callback_query.answer()
+    if genre:
+        await search_and_send_movies(callback_query.message, search_movies_by_genre, genre=genre, limit=LIMIT, page=1, state=state)
+
+def parse_movie_id(value: Any) -> Optional[int]:
+    """
+    Id фильма из callback_data или записи истории; None, если id нет или он не число.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# Кнопки mark_ больше не отправляются (история отмечает просмотр через hist_mark),
+# но остаются под сообщениями истории, отправленными прежними версиями бота
 @dp.callback_query(lambda c: c.data.startswith("mark_"))
 async def mark_movie_status(callback_query: CallbackQuery) -> None:
    
@@ -219,23 +392,20 @@ async def mark_movie_status(callback_query: CallbackQuery) -> None:
     parts = data.split("_", 2)
 
     action = f"{parts[0]}_{parts[1]}"
-    movie_id = parts[2]
+    movie_id = parse_movie_id(parts[2])
+    if movie_id is None:
+        await callback_query.answer("Не удалось определить фильм.")
+        return
 
+    chat_id = callback_query.message.chat.id
     if action == "mark_watched":
-        mark_movie_as_watched(movie_id, True)
+        mark_movie_as_watched(chat_id, movie_id, True)
+        recommender.on_watch_changed(chat_id, movie_id, True)
     elif action == "mark_not_watched":
-        mark_movie_as_watched(movie_id, False)
+        mark_movie_as_watched(chat_id, movie_id, False)
+        recommender.on_watch_changed(chat_id, movie_id, False)
     await callback_query.message.edit_reply_markup()  # Убираем клавиатуру после обработки
-
-def get_watch_buttons(movie_id: str) -> InlineKeyboardMarkup:
-    
-    buttons = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="Просмотрен", callback_data=f"mark_watched_{movie_id}"),
-            InlineKeyboardButton(text="Не просмотрен", callback_data=f"mark_not_watched_{movie_id}")
-        ]
-    ])
-    return buttons
+    await callback_query.answer()
 
 def parse_date(date_str: str) -> Optional[str]:
     
@@ -252,10 +422,50 @@ def parse_date(date_str: str) -> Optional[str]:
                 return None
     return parsed_date.strftime("%d-%m-%Y")
 
+def get_history_page(chat_id: int, date_str: str, offset: int) -> Optional[Tuple[Dict[str, Any], int, int]]:
+    """
+    Загружает одну запись истории за день.
+
+    Returns:
+        Optional[Tuple[Dict[str, Any], int, int]]: Запись, ее номер (с поправкой на границы) и количество записей за день
+        или None, если записей нет.
+    """
+    total = count_history_by_date(chat_id, date_str)
+    if not total:
+        return None
+    offset = min(max(offset, 0), total - 1)
+    entries = get_history_by_date(chat_id, date_str, offset=offset, limit=1)
+    if not entries:
+        return None
+    return entries[0], offset, total
+
+async def edit_history_page(callback_query: CallbackQuery, date_str: str, offset: int) -> None:
+    """
+    Перерисовывает сообщение с историей на месте вместо отправки нового.
+    """
+    page = get_history_page(callback_query.message.chat.id, date_str, offset)
+    try:
+        if page is None:
+            await callback_query.message.edit_text("История за указанную дату не найдена.")
+        else:
+            entry, offset, total = page
+            await callback_query.message.edit_text(
+                format_history_entry(entry, offset, total),
+                parse_mode='Markdown',
+                reply_markup=get_history_buttons(
+                    date_str, offset, total, bool(entry.get('poster')), entry.get('id') is not None
+                )
+            )
+    except TelegramBadRequest as e:
+        # Повторное нажатие той же кнопки не меняет сообщение
+        if "message is not modified" not in str(e):
+            raise
+
 @dp.message(SearchState.waiting_for_history_date)
 async def show_history_for_date(message: Message, state: FSMContext) -> None:
     """
-    Показывает историю запросов за указанную дату.
+    Показывает историю запросов за указанную дату одним сообщением,
+    которое листается кнопками.
     
     Args:
         message (Message): Сообщение от пользователя.
@@ -265,30 +475,16 @@ async def show_history_for_date(message: Message, state: FSMContext) -> None:
     formatted_date = parse_date(date_str)
     
     if formatted_date:
-        history = get_history_by_date(formatted_date)
-        if history:
-            for entry in history:
-                movie_info = (
-                    f"*Дата поиска:* {entry['date']}\n"
-                    f"*Название:* {entry['title']}\n"
-                    f"*Описание:* {entry['description'] or 'Нет описания'}\n"
-                    f"*Рейтинг:* {entry['rating']}\n"
-                    f"*Год производства:* {entry['year']}\n"
-                    f"*Жанр:* {entry['genre']}\n"
-                    f"*Возрастной рейтинг:* {entry['age_rating']}\n"
-                    f"*Статус:* {'Просмотрен' if entry.get('watched', False) else 'Не просмотрен'}\n"
+        page = get_history_page(message.chat.id, formatted_date, 0)
+        if page:
+            entry, offset, total = page
+            await message.answer(
+                format_history_entry(entry, offset, total),
+                parse_mode='Markdown',
+                reply_markup=get_history_buttons(
+                    formatted_date, offset, total, bool(entry.get('poster')), entry.get('id') is not None
                 )
-                await message.answer(movie_info, parse_mode='Markdown')
-
-                # Отправка постера, если он есть
-                if entry.get('poster'):
-                    await bot.send_photo(message.chat.id, entry['poster'])
-
-                # Кнопки для отмечания как просмотренного или непросмотренного
-                markup = get_watch_buttons(entry['id'])
-                await message.answer("Отметьте статус фильма:", reply_markup=markup)
-
-            await message.answer("Вы можете отметить фильмы как просмотренные или непросмотренные.", reply_markup=get_main_menu())
+            )
         else:
             await message.answer("История за указанную дату не найдена.")
     else:
@@ -296,6 +492,46 @@ async def show_history_for_date(message: Message, state: FSMContext) -> None:
 
     await state.clear()
 
+@dp.callback_query(lambda c: c.data.startswith("hist:"))
+async def history_navigate(callback_query: CallbackQuery) -> None:
+    
+    _, date_str, offset = callback_query.data.split(":")
+    await edit_history_page(callback_query, date_str, int(offset))
+    await callback_query.answer()
+
+@dp.callback_query(lambda c: c.data.startswith("hist_mark:"))
+async def history_mark(callback_query: CallbackQuery) -> None:
+    
+    _, watched, date_str, offset = callback_query.data.split(":")
+    page = get_history_page(callback_query.message.chat.id, date_str, int(offset))
+    if page:
+        movie_id = parse_movie_id(page[0]['id'])
+        if movie_id is None:
+            # Статус хранится по id фильма, у записи без id отмечать нечего
+            await callback_query.answer("Не удалось определить фильм.")
+            return
+        mark_movie_as_watched(callback_query.message.chat.id, movie_id, watched == "1")
+        recommender.on_watch_changed(callback_query.message.chat.id, movie_id, watched == "1")
+    await edit_history_page(callback_query, date_str, int(offset))
+    await callback_query.answer()
+
+@dp.callback_query(lambda c: c.data.startswith("hist_poster:"))
+async def history_poster(callback_query: CallbackQuery) -> None:
+    """
+    Отправляет постер записи истории только по запросу пользователя.
+    """
+    _, date_str, offset = callback_query.data.split(":")
+    page = get_history_page(callback_query.message.chat.id, date_str, int(offset))
+    poster = await resolve_poster(page[0]['id'], page[0].get('poster')) if page else None
+    if poster:
+        entry = page[0]
+        sent_message = await bot.send_photo(callback_query.message.chat.id, poster)
+        if sent_message.photo:
+            remember_file_id(entry['id'], entry['poster'], sent_message.photo[-1].file_id)
+        await callback_query.answer()
+    else:
+        await callback_query.answer("Постер недоступен")
+
 @dp.message(Command(commands=['history']))
 async def request_history_date(message: Message, state: FSMContext) -> None:
    
@@ -342,14 +578,17 @@ async def handle_message(message: Message, state: FSMContext) -> None:
             await message.answer("Пожалуйста, введите корректный диапазон годов в формате: от-до.")
 
     elif current_state == SearchState.waiting_for_genre.state:
-        genre = text.strip()
-        await search_and_send_movies(message, search_movies_by_genre, genre=genre, limit=LIMIT, page=1, state=state)
+        genre = normalize_genre(text)
+        if genre:
+            await search_and_send_movies(message, search_movies_by_genre, genre=genre, limit=LIMIT, page=1, state=state)
+        else:
+            await message.answer("Такой жанр не найден. Выберите жанр из списка:", reply_markup=get_genre_menu())
 
 async def refresh_search(message: Message, state: FSMContext) -> None:
    
-    data = await state.get_data()
-    search_function = data.get('search_function')
-    kwargs = data.get('kwargs', {})
+    query = (await state.get_data()).get('query', {})
+    search_function = SEARCH_FUNCTIONS.get(query.get('name'))
+    kwargs = query.get('kwargs', {})
     page = kwargs.get('page', 1) + 1
     kwargs['page'] = page
 
@@ -361,9 +600,75 @@ async def refresh_search(message: Message, state: FSMContext) -> None:
     else:
         await message.answer("Нет предыдущего запроса для обновления.")
 
+# Длительность шагов прогрева в секундах и фоновая задача прогрева
+warmup_timings: Dict[str, float] = {}
+warmup_task: Optional["asyncio.Task[None]"] = None
+# Ежедневная рассылка подборки новинок
+digest_task: Optional["asyncio.Task[None]"] = None
+
+async def warm_up() -> None:
+    """
+    Прогревает базы, кэши и пулы соединений в фоне, пока бот уже принимает обновления.
+    Сбой шага не мешает работе: все ресурсы создаются и при первом обращении.
+    """
+    steps: List[Tuple[str, Callable[[], Any]]] = [
+        ("menus", lambda: (get_main_menu(), get_genre_menu())),
+        # Открытие базы с переносом history.json и чтение истории идут в рабочем потоке
+        ("history", lambda: asyncio.to_thread(open_history)),
+        ("title_index", title_index.load_in_background),
+        ("kinopoisk", warm_up_kinopoisk),
+        ("posters", warm_up_posters),
+        ("telegram", bot.get_me),
+        ("recommendations", recommender.prepare),
+    ]
+    for name, step in steps:
+        # Перед каждым шагом цикл событий обрабатывает уже пришедшие обновления
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        try:
+            result = step()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.warning("Прогрев %s не выполнен", name, exc_info=True)
+        warmup_timings[name] = time.perf_counter() - started
+    logger.info("Прогрев завершен за %.3f с", sum(warmup_timings.values()))
+
+async def on_startup() -> None:
+    
+    global warmup_task, digest_task
+    # История пишется в фоне пачками, ответ пользователю не ждет диска
+    start_history_writer()
+    if WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(warm_up())
+    if DIGEST_HOUR >= 0:
+        digest_task = asyncio.create_task(digest_scheduler(bot, DIGEST_HOUR))
+
+async def on_shutdown() -> None:
+    
+    for task in (warmup_task, digest_task):
+        if task is not None and not task.done():
+            task.cancel()
+    await stop_history_writer()
+    await close_session()
+    await close_poster_session()
+    response_cache.close()
+    poster_cache.close()
+    await dp.storage.close()
+    close_history()
+
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
 async def main() -> None:
     
-    await dp.start_polling(bot)
+    logging.basicConfig(level=LOG_LEVEL)
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Кэш ответов API с TTL по эндпоинтам, ограничением размера (LRU),
+    необязательным хранением на диске (SQLite) и объединением одинаковых
+    одновременных запросов в один (single-flight). Устаревшие записи хранятся
+    еще stale_ttl секунд и отдаются, если запрос к API завершился ошибкой.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        default_ttl: float = 600.0,
+        ttls: Optional[Dict[str, float]] = None,
+        db_path: Optional[str] = None,
+        stale_ttl: float = 0.0,
+        encode: Optional[Callable[[Any], Any]] = None,
+        decode: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        table: str = "response_cache",
+    ) -> None:
+        """
+        :param max_entries: Максимальное количество записей в памяти.
+        :param default_ttl: Время жизни записи по умолчанию, в секундах.
+        :param ttls: Время жизни записей для отдельных эндпоинтов.
+        :param db_path: Путь к файлу SQLite. Если не задан, кэш хранится только в памяти.
+        :param stale_ttl: Сколько секунд после истечения TTL запись отдается при ошибке запроса.
+        :param encode: Обработчик default для json.dumps при записи на диск (для объектов в ответах).
+        :param decode: Преобразование записи, прочитанной с диска, обратно в формат ответа.
+        :param table: Таблица SQLite; у каждого кэша в общем файле своя таблица.
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.stale_ttl = stale_ttl
+        self.table = table
+        self._encode = encode
+        self._decode = decode
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self.db_path = db_path
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute(f"DELETE FROM {table} WHERE expires_at <= ?", (time.time() - stale_ttl,))
+            self._db.commit()
+
+    @staticmethod
+    def make_key(endpoint: str, params: Dict[str, Any]) -> str:
+        """
+        Строит нормализованный ключ: параметры сортируются, строки приводятся
+        к нижнему регистру без крайних пробелов.
+        """
+        normalized = {
+            name: value.strip().casefold() if isinstance(value, str) else value
+            for name, value in params.items()
+        }
+        return f"{endpoint}?{json.dumps(normalized, sort_keys=True, ensure_ascii=False)}"
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает актуальную запись из памяти или с диска, либо None.
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return value
+            if expires_at + self.stale_ttl <= now:
+                del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                value = self._load(row[0])
+                self._remember(key, value, row[1])
+                return value
+        return None
+
+    def lookup(
+        self, key: str, usable: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        То же, что get, но с учетом попаданий и промахов для кэшей, которые
+        заполняются не через get_or_fetch.
+
+        :param usable: Проверка записи; отвергнутая запись считается промахом.
+        """
+        value = self.get(key)
+        if value is None or (usable is not None and not usable(value)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def _load(self, raw: str) -> Dict[str, Any]:
+
+        value = json.loads(raw)
+        return self._decode(value) if self._decode is not None else value
+
+    def get_stale(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает запись, даже если ее TTL истек, но не позже stale_ttl после этого.
+        """
+        oldest = time.time() - self.stale_ttl
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > oldest:
+            return entry[1]
+        if self._db is not None:
+            row = self._db.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?", (key, oldest)
+            ).fetchone()
+            if row is not None:
+                return self._load(row[0])
+        return None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        """
+        Сохраняет запись в памяти и, если включено, на диске.
+        """
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=self._encode), expires_at)
+            )
+            self._db.commit()
+
+    def read_fresh(self) -> List[Tuple[str, Dict[str, Any], float]]:
+        """
+        Читает с диска самые свежие актуальные записи через отдельное соединение,
+        поэтому может выполняться в рабочем потоке.
+
+        :return: Список (ключ, ответ, время истечения), от самых свежих к старым.
+        """
+        if not self.db_path:
+            return []
+        connection = sqlite3.connect(self.db_path)
+        try:
+            rows = connection.execute(
+                f"SELECT key, value, expires_at FROM {self.table} WHERE expires_at > ? "
+                "ORDER BY expires_at DESC LIMIT ?",
+                (time.time(), self.max_entries)
+            ).fetchall()
+        finally:
+            connection.close()
+        return [(key, self._load(raw), expires_at) for key, raw, expires_at in rows]
+
+    def preload(self, entries: Optional[List[Tuple[str, Dict[str, Any], float]]] = None) -> int:
+        """
+        Загружает в память самые свежие актуальные записи с диска, чтобы первые
+        запросы после запуска не читали базу.
+
+        :param entries: Записи, заранее прочитанные read_fresh. Если не заданы, читаются здесь.
+        :return: Количество загруженных записей.
+        """
+        if entries is None:
+            entries = self.read_fresh()
+        # Самые свежие записи добавляются последними и вытесняются последними;
+        # записи, уже попавшие в память после запуска, не перезаписываются
+        for key, value, expires_at in reversed(entries):
+            if key not in self._entries:
+                self._remember(key, value, expires_at)
+        return len(entries)
+
+    def _remember(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Возвращает ответ из кэша или выполняет fetch. Одновременные запросы
+        с одинаковым ключом ожидают один общий вызов fetch. Ответы с ошибкой
+        не кэшируются; вместо них отдается устаревшая запись, если она есть.
+
+        :param endpoint: Эндпоинт API, определяет TTL записи.
+        :param params: Параметры запроса.
+        :param fetch: Корутина, выполняющая запрос к API.
+        :return: Ответ API.
+        """
+        key = self.make_key(endpoint, params)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            self.misses += 1
+            inflight = asyncio.ensure_future(fetch())
+            self._inflight[key] = inflight
+            inflight.add_done_callback(lambda done: self._finish(key, endpoint, done))
+        else:
+            self.hits += 1
+
+        # shield: отмена одного из ожидающих не должна отменять общий запрос
+        result = await asyncio.shield(inflight)
+        if 'error' in result:
+            stale = self.get_stale(key)
+            if stale is not None:
+                self.stale_hits += 1
+                return stale
+        return result
+
+    def _finish(self, key: str, endpoint: str, done: "asyncio.Future[Dict[str, Any]]") -> None:
+        self._inflight.pop(key, None)
+        if done.cancelled() or done.exception() is not None:
+            return
+        result = done.result()
+        if 'error' not in result:
+            self.set(key, result, self.ttl_for(endpoint))
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Метрики кэша: попадания, промахи, доля попаданий и число записей в памяти.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,315 @@
+"""
+Локальная копия каталога фильмов КиноПоиска.
+
+    python catalog.py sync                 # загрузить изменения с последней синхронизации
+    python catalog.py sync --full          # полная загрузка (продолжается с места остановки)
+    python catalog.py load dump.json       # загрузить записанный дамп ответов API
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from config import CATALOG_DB_PATH, CATALOG_MAX_AGE, CATALOG_PAGE_SIZE
+from movies import Movie
+
+Range = Tuple[float, float]
+
+
+class Catalog:
+    """
+    Каталог фильмов в SQLite с индексами по году, жанру, рейтингу IMDb и бюджету.
+    Отвечает на те же выборки, что и эндпоинт /movie, в формате ответа API.
+    Размер и время синхронизации перечитываются раз в refresh_interval секунд:
+    синхронизацию обычно выполняет отдельный процесс (catalog.py sync по cron).
+    """
+
+    refresh_interval = 60.0
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS movies ("
+                "id INTEGER PRIMARY KEY, name TEXT, year INTEGER, rating_imdb REAL, "
+                "budget REAL, doc TEXT NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS movie_genres ("
+                "genre TEXT NOT NULL, movie_id INTEGER NOT NULL, PRIMARY KEY (genre, movie_id)) WITHOUT ROWID"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            # Жанры фильма заменяются при каждом обновлении: без индекса удаление просматривало бы всю таблицу
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_movie_genres_movie ON movie_genres (movie_id)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_movies_rating ON movies (rating_imdb)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_movies_budget ON movies (budget)")
+        # Номер изменения каталога: по нему производные индексы узнают, что устарели
+        self.revision = 0
+        self._size = 0
+        self._last_sync = 0.0
+        self._checked_at = 0.0
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Перечитывает размер каталога и время последней синхронизации, которые мог
+        изменить другой процесс.
+        """
+        size = self._db.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+        last_sync = self.get_meta("last_sync")
+        last_sync = float(last_sync) if last_sync else 0.0
+        if (size, last_sync) != (self._size, self._last_sync):
+            self.revision += 1
+        self._size = size
+        self._last_sync = last_sync
+        self._checked_at = time.monotonic()
+
+    def get_meta(self, key: str) -> Optional[str]:
+
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: Optional[str]) -> None:
+
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_ready(self) -> bool:
+        """
+        Каталог можно использовать вместо API: он не пуст и синхронизирован недавно.
+        """
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+        return self._size > 0 and time.time() - self._last_sync < CATALOG_MAX_AGE
+
+    def upsert(self, docs: Iterable[Union[Movie, Dict[str, Any]]]) -> int:
+        """
+        Добавляет или обновляет фильмы одной транзакцией.
+
+        :param docs: Записи Movie или документы в формате API.
+        :return: Количество записанных фильмов.
+        """
+        movies = [doc if isinstance(doc, Movie) else Movie.from_doc(doc) for doc in docs]
+        movies = [movie for movie in movies if movie.id and movie.name]
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO movies (id, name, year, rating_imdb, budget, doc) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        movie.id,
+                        movie.name,
+                        movie.year,
+                        movie.rating,
+                        movie.budget,
+                        json.dumps(movie.to_doc(), ensure_ascii=False, separators=(",", ":")),
+                    )
+                    for movie in movies
+                ]
+            )
+            self._db.executemany(
+                "DELETE FROM movie_genres WHERE movie_id = ?", [(movie.id,) for movie in movies]
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO movie_genres (genre, movie_id) VALUES (?, ?)",
+                [(genre.casefold(), movie.id) for movie in movies for genre in movie.genres]
+            )
+        self._size = self._db.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+        self.revision += 1
+        return len(movies)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def features(self) -> List[Tuple[int, Optional[int], Optional[float], Tuple[str, ...]]]:
+        """
+        Признаки всех фильмов без разбора документов: id, год, рейтинг IMDb и жанры.
+        Читаются через отдельное соединение, поэтому метод можно вызывать из рабочего потока.
+        """
+        db = sqlite3.connect(self.db_path)
+        try:
+            genres: Dict[int, List[str]] = {}
+            for genre, movie_id in db.execute("SELECT genre, movie_id FROM movie_genres"):
+                genres.setdefault(movie_id, []).append(genre)
+            return [
+                (movie_id, year, rating, tuple(genres.get(movie_id, ())))
+                for movie_id, year, rating in db.execute("SELECT id, year, rating_imdb FROM movies ORDER BY id")
+            ]
+        finally:
+            db.close()
+
+    def get_many(self, ids: List[int]) -> List[Movie]:
+        """
+        Фильмы по списку id в том же порядке; отсутствующие в каталоге пропускаются.
+        """
+        rows = dict(self._db.execute(
+            f"SELECT id, doc FROM movies WHERE id IN ({', '.join('?' for _ in ids)})", ids
+        ).fetchall()) if ids else {}
+        return [Movie.from_doc(json.loads(rows[movie_id])) for movie_id in ids if movie_id in rows]
+
+    def mark_synced(self, timestamp: Optional[float] = None) -> None:
+
+        self._last_sync = timestamp or time.time()
+        self.set_meta("last_sync", str(self._last_sync))
+
+    def search(
+        self,
+        rating: Optional[Range] = None,
+        year: Optional[Range] = None,
+        genre: Optional[str] = None,
+        budget: Optional[Range] = None,
+        page: int = 1,
+        limit: int = 5,
+    ) -> Dict[str, Any]:
+        """
+        Выборка фильмов по фильтрам, все границы диапазонов включительно.
+
+        :return: Ответ в формате API: docs (записи Movie), page, limit, pages.
+        """
+        tables = "movies"
+        order = "movies.id"
+        conditions: List[str] = []
+        args: List[Any] = []
+        if genre:
+            tables = "movie_genres JOIN movies ON movies.id = movie_genres.movie_id"
+            # Порядок по ключу movie_genres позволяет обойтись без сортировки
+            order = "movie_genres.movie_id"
+            conditions.append("movie_genres.genre = ?")
+            args.append(genre.strip().casefold())
+        for column, bounds in (("rating_imdb", rating), ("year", year), ("budget", budget)):
+            if bounds is not None:
+                conditions.append(f"movies.{column} BETWEEN ? AND ?")
+                args.extend(bounds)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Запрашивается на одну запись больше, чтобы узнать, есть ли следующая страница
+        rows = self._db.execute(
+            f"SELECT movies.doc FROM {tables} {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            (*args, limit + 1, (page - 1) * limit)
+        ).fetchall()
+        return {
+            "docs": [Movie.from_doc(json.loads(row[0])) for row in rows[:limit]],
+            "page": page,
+            "limit": limit,
+            "pages": page + 1 if len(rows) > limit else page,
+        }
+
+    async def sync(
+        self,
+        fetch: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        full: bool = False,
+        max_pages: Optional[int] = None,
+    ) -> int:
+        """
+        Загружает фильмы из API постранично.
+
+        При полной загрузке номер последней загруженной страницы сохраняется,
+        и прерванная загрузка продолжается с него. Инкрементальная загрузка
+        запрашивает только фильмы, измененные после прошлой синхронизации.
+
+        :param fetch: Функция запроса страницы /movie (kinopoisk_api.fetch_movies).
+        :param full: Загрузить весь каталог.
+        :param max_pages: Ограничение числа запросов за запуск (квота ключа API).
+        :return: Количество загруженных фильмов.
+        """
+        started = time.time()
+        params: Dict[str, Any] = {"limit": CATALOG_PAGE_SIZE, "notNullFields": "name"}
+        if full:
+            page = int(self.get_meta("full_sync_page") or 0) + 1
+        else:
+            page = 1
+            since = datetime.fromtimestamp(self._last_sync).strftime("%d.%m.%Y")
+            params["updatedAt"] = f"{since}-{datetime.now().strftime('%d.%m.%Y')}"
+
+        loaded = 0
+        requests_made = 0
+        while max_pages is None or requests_made < max_pages:
+            response = await fetch({**params, "page": page})
+            requests_made += 1
+            if "error" in response:
+                raise RuntimeError(f"Синхронизация каталога прервана на странице {page}: {response['error']}")
+            loaded += self.upsert(response.get("docs") or [])
+            if full:
+                self.set_meta("full_sync_page", str(page))
+            if page >= response.get("pages", 0):
+                if full:
+                    self.set_meta("full_sync_page", None)
+                self.mark_synced(started)
+                break
+            page += 1
+        return loaded
+
+    def load_dump(self, path: str) -> int:
+        """
+        Загружает записанный дамп: список документов фильмов, ответ API с docs
+        или список таких ответов.
+
+        :return: Количество загруженных фильмов.
+        """
+        with open(path, "r", encoding="utf-8") as file:
+            dump = json.load(file)
+        responses = dump if isinstance(dump, list) and dump and "docs" in dump[0] else [dump]
+        loaded = 0
+        for response in responses:
+            loaded += self.upsert(response["docs"] if isinstance(response, dict) else response)
+        self.mark_synced()
+        return loaded
+
+    def close(self) -> None:
+
+        self._db.close()
+
+
+_catalog: Optional[Catalog] = None
+
+def get_catalog(create: bool = False) -> Optional[Catalog]:
+    """
+    Возвращает каталог или None, если файл каталога еще не создан.
+
+    :param create: Создать файл каталога при отсутствии.
+    """
+    global _catalog
+    if _catalog is None:
+        if not create and not os.path.exists(CATALOG_DB_PATH):
+            return None
+        _catalog = Catalog(CATALOG_DB_PATH)
+    return _catalog
+
+
+async def _sync(full: bool, max_pages: Optional[int]) -> int:
+
+    from kinopoisk_api import close_session, fetch_movies
+
+    try:
+        return await get_catalog(create=True).sync(fetch_movies, full=full, max_pages=max_pages)
+    finally:
+        await close_session()
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Синхронизация локального каталога фильмов")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sync_parser = commands.add_parser("sync", help="загрузить фильмы из API")
+    sync_parser.add_argument("--full", action="store_true", help="полная загрузка")
+    sync_parser.add_argument("--max-pages", type=int, help="максимум запросов за запуск")
+    load_parser = commands.add_parser("load", help="загрузить дамп из файла")
+    load_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        loaded = asyncio.run(_sync(args.full, args.max_pages))
+    else:
+        loaded = get_catalog(create=True).load_dump(args.path)
+    print(f"Загружено фильмов: {loaded}")
+
+
+if __name__ == "__main__":
+    main()
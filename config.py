@@ -3,3 +3,126 @@ import os
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 KINOPOISK_API_KEY = os.getenv('KINOPOISK_API_KEY')
 KINOPOISK_BASE_URL = os.getenv('KINOPOISK_BASE_URL', 'https://api.kinopoisk.dev/v1.4/movie')
+
+# Пул ключей API КиноПоиск: KINOPOISK_API_KEYS через запятую, иначе единственный KINOPOISK_API_KEY
+KINOPOISK_API_KEYS = [
+    key.strip() for key in os.getenv('KINOPOISK_API_KEYS', KINOPOISK_API_KEY or '').split(',') if key.strip()
+]
+KINOPOISK_KEYS_DB_PATH = os.getenv('KINOPOISK_KEYS_DB_PATH', 'keys.db')
+KINOPOISK_KEY_DAILY_LIMIT = int(os.getenv('KINOPOISK_KEY_DAILY_LIMIT', '200'))  # 0 - без ограничения
+KINOPOISK_KEY_COOLDOWN = float(os.getenv('KINOPOISK_KEY_COOLDOWN', '60'))  # Пауза ключа после 429
+KINOPOISK_KEY_INVALID_COOLDOWN = float(os.getenv('KINOPOISK_KEY_INVALID_COOLDOWN', '3600'))  # Пауза ключа после 401/403
+KINOPOISK_KEYS_SYNC_INTERVAL = float(os.getenv('KINOPOISK_KEYS_SYNC_INTERVAL', '2'))  # Как часто счетчики процесса записываются в базу
+
+# Пул соединений к API КиноПоиск
+KINOPOISK_CONNECTION_LIMIT = int(os.getenv('KINOPOISK_CONNECTION_LIMIT', '100'))
+KINOPOISK_CONNECTION_LIMIT_PER_HOST = int(os.getenv('KINOPOISK_CONNECTION_LIMIT_PER_HOST', '20'))
+KINOPOISK_KEEPALIVE_TIMEOUT = float(os.getenv('KINOPOISK_KEEPALIVE_TIMEOUT', '30'))
+KINOPOISK_CONNECT_TIMEOUT = float(os.getenv('KINOPOISK_CONNECT_TIMEOUT', '5'))
+KINOPOISK_TIMEOUT = float(os.getenv('KINOPOISK_TIMEOUT', '15'))
+
+# Повторы и размыкатель для запросов к API КиноПоиск
+KINOPOISK_DEADLINE = float(os.getenv('KINOPOISK_DEADLINE', '10'))  # Время на запрос вместе с повторами, в секундах
+KINOPOISK_RETRIES = int(os.getenv('KINOPOISK_RETRIES', '2'))
+KINOPOISK_BACKOFF_BASE = float(os.getenv('KINOPOISK_BACKOFF_BASE', '0.2'))
+KINOPOISK_BACKOFF_MAX = float(os.getenv('KINOPOISK_BACKOFF_MAX', '2'))
+KINOPOISK_BREAKER_THRESHOLD = int(os.getenv('KINOPOISK_BREAKER_THRESHOLD', '5'))
+KINOPOISK_BREAKER_RESET = float(os.getenv('KINOPOISK_BREAKER_RESET', '30'))
+
+# Кэш ответов API КиноПоиск
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+CACHE_DEFAULT_TTL = float(os.getenv('CACHE_DEFAULT_TTL', '3600'))
+CACHE_SEARCH_TTL = float(os.getenv('CACHE_SEARCH_TTL', '86400'))
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', '')
+CACHE_STALE_TTL = float(os.getenv('CACHE_STALE_TTL', '604800'))  # Сколько устаревший ответ отдается при сбое API
+
+# История запросов
+HISTORY_DB_PATH = os.getenv('HISTORY_DB_PATH', 'history.db')
+# Чат, которому принадлежат записи history.json, сохраненные до разделения истории по пользователям
+HISTORY_LEGACY_USER_ID = int(os.environ['HISTORY_LEGACY_USER_ID']) if os.getenv('HISTORY_LEGACY_USER_ID') else None
+# Отложенная запись истории: пачка записывается раз в HISTORY_FLUSH_INTERVAL секунд или по HISTORY_FLUSH_BATCH операциям
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '1'))
+HISTORY_FLUSH_BATCH = int(os.getenv('HISTORY_FLUSH_BATCH', '500'))
+
+# Кэш готовых карточек фильмов
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv('RENDER_CACHE_MAX_ENTRIES', '5000'))
+
+# Проверка постеров
+POSTER_CHECK_CONCURRENCY = int(os.getenv('POSTER_CHECK_CONCURRENCY', '10'))
+POSTER_CHECK_TIMEOUT = float(os.getenv('POSTER_CHECK_TIMEOUT', '5'))
+POSTER_CACHE_MAX_ENTRIES = int(os.getenv('POSTER_CACHE_MAX_ENTRIES', '10000'))
+POSTER_CACHE_TTL = float(os.getenv('POSTER_CACHE_TTL', '604800'))
+# Сколько секунд помнить постер, проверка которого не удалась из-за таймаута или ошибки сервера
+POSTER_RETRY_TTL = float(os.getenv('POSTER_RETRY_TTL', '300'))
+
+# Количество процессов бота (webhook.py --workers задает его сам): лимиты на весь бот делятся между процессами
+BOT_PROCESSES = max(int(os.getenv('BOT_PROCESSES', '1')), 1)
+
+# Ограничения частоты отправки в Telegram
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30')) / BOT_PROCESSES
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', '10'))
+TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', str(20 / 60)))
+TELEGRAM_GROUP_BURST = float(os.getenv('TELEGRAM_GROUP_BURST', '5'))
+TELEGRAM_SEND_RETRIES = int(os.getenv('TELEGRAM_SEND_RETRIES', '3'))
+
+# Хранилище состояний FSM: Redis, если задан FSM_REDIS_URL, иначе SQLite
+FSM_DB_PATH = os.getenv('FSM_DB_PATH', 'fsm.db')
+FSM_REDIS_URL = os.getenv('FSM_REDIS_URL', '')
+
+# Адрес Bot API, например локального сервера telegram-bot-api или заглушки для тестов
+TELEGRAM_API_SERVER = os.getenv('TELEGRAM_API_SERVER', '')
+
+# Режим webhook
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '1'))
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', '100'))
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv('WEBHOOK_SHUTDOWN_TIMEOUT', '30'))
+
+# Предзагрузка следующей страницы для кнопки "Обновить"
+PREFETCH_TTL = float(os.getenv('PREFETCH_TTL', '120'))
+PREFETCH_MAX_USERS = int(os.getenv('PREFETCH_MAX_USERS', '10000'))
+PREFETCH_BUDGET_PER_MINUTE = float(os.getenv('PREFETCH_BUDGET_PER_MINUTE', '30')) / BOT_PROCESSES
+PREFETCH_MAX_CONCURRENT = max(int(os.getenv('PREFETCH_MAX_CONCURRENT', '5')) // BOT_PROCESSES, 1)
+
+# Локальный каталог фильмов
+CATALOG_DB_PATH = os.getenv('CATALOG_DB_PATH', 'catalog.db')
+CATALOG_MAX_AGE = float(os.getenv('CATALOG_MAX_AGE', str(7 * 24 * 3600)))
+CATALOG_PAGE_SIZE = int(os.getenv('CATALOG_PAGE_SIZE', '250'))
+
+# Локальный нечеткий поиск по названиям
+TITLE_INDEX_MAX_MOVIES = int(os.getenv('TITLE_INDEX_MAX_MOVIES', '50000'))
+TITLE_MATCH_THRESHOLD = float(os.getenv('TITLE_MATCH_THRESHOLD', '0.5'))
+
+# Рекомендации по просмотренным фильмам
+RECOMMEND_MAX_USERS = int(os.getenv('RECOMMEND_MAX_USERS', '10000'))
+RECOMMEND_RESULTS = int(os.getenv('RECOMMEND_RESULTS', '50'))  # Длина списка рекомендаций пользователя
+RECOMMEND_INDEX_TTL = float(os.getenv('RECOMMEND_INDEX_TTL', '3600'))
+RECOMMEND_HISTORY_POOL = int(os.getenv('RECOMMEND_HISTORY_POOL', '5000'))  # Кандидаты из истории, если нет каталога
+
+# Максимум одновременных поисков на весь бот
+SEARCH_MAX_CONCURRENT = max(int(os.getenv('SEARCH_MAX_CONCURRENT', '10')) // BOT_PROCESSES, 1)
+
+# Ежедневная подборка новинок в любимых жанрах подписчиков
+DIGEST_DB_PATH = os.getenv('DIGEST_DB_PATH', 'digest.db')
+DIGEST_HOUR = int(os.getenv('DIGEST_HOUR', '10'))  # Час рассылки по местному времени; -1 - только через python digest.py run
+DIGEST_YEARS = int(os.getenv('DIGEST_YEARS', '1'))  # Сколько последних лет выпуска считаются новинками
+DIGEST_GENRES = int(os.getenv('DIGEST_GENRES', '3'))  # Любимых жанров на подписчика
+DIGEST_MOVIES = int(os.getenv('DIGEST_MOVIES', '5'))  # Фильмов в подборке
+DIGEST_CANDIDATES = int(os.getenv('DIGEST_CANDIDATES', '50'))  # Фильмов в ответе на запрос: из них выбираются еще не отправленные
+DIGEST_FETCH_CONCURRENCY = int(os.getenv('DIGEST_FETCH_CONCURRENCY', '5'))
+DIGEST_SEND_CONCURRENCY = int(os.getenv('DIGEST_SEND_CONCURRENCY', '50'))
+DIGEST_LEASE = float(os.getenv('DIGEST_LEASE', '300'))  # Через сколько секунд без отметок брошенную рассылку продолжит другой процесс
+
+# Прогрев соединений и кэшей в фоне после запуска: 0 - ресурсы создаются при первом запросе
+WARMUP_ENABLED = int(os.getenv('WARMUP_ENABLED', '1'))
+
+# Метрики и журнал
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 - метрики не публикуются
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))  # Доля запросов к API, попадающих в журнал DEBUG
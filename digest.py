@@ -0,0 +1,549 @@
+"""
+Ежедневная подборка новинок в любимых жанрах подписчиков.
+
+Рассылка идет в три этапа, каждый сохраняет результат в базе DIGEST_DB_PATH:
+подписчики группируются по набору запросов (жанр, год), каждый запрос
+выполняется один раз, подборки отправляются через общую очередь отправки
+с низким приоритетом. Прерванная рассылка продолжается с места остановки.
+
+    python digest.py run                   # выполнить или продолжить сегодняшнюю рассылку
+    python digest.py run --run-id 2024-05-01
+    python digest.py status                # состояние последних рассылок
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from config import (
+    DIGEST_CANDIDATES,
+    DIGEST_DB_PATH,
+    DIGEST_FETCH_CONCURRENCY,
+    DIGEST_GENRES,
+    DIGEST_HOUR,
+    DIGEST_LEASE,
+    DIGEST_MOVIES,
+    DIGEST_SEND_CONCURRENCY,
+    DIGEST_YEARS,
+)
+from genres import normalize_genre
+from history_manager import get_favourite_genres
+from movies import Movie, encode_movie, parse_response
+from render import MESSAGE_LIMIT, escape_markdown
+from send_queue import bulk_sends
+
+logger = logging.getLogger(__name__)
+
+# Запрос подборки: жанр в API и год выпуска
+Query = Tuple[str, int]
+
+# Состояния получателя в рассылке
+PENDING = 0
+SENT = 1
+SKIPPED = 2
+
+
+class DigestStore:
+    """
+    Подписки и контрольные точки рассылок в SQLite.
+
+    Рассылка захватывается процессом на DIGEST_LEASE секунд и продлевается после
+    каждой контрольной точки в транзакции BEGIN IMMEDIATE, поэтому несколько
+    процессов бота не отправят одну подборку дважды, а брошенную рассылку
+    продолжит другой процесс.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions (user_id INTEGER PRIMARY KEY, genres TEXT NOT NULL DEFAULT '')"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id TEXT PRIMARY KEY, owner TEXT, lease_until REAL NOT NULL DEFAULT 0, "
+            "planned INTEGER NOT NULL DEFAULT 0, started_at REAL NOT NULL, finished_at REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS run_queries ("
+            "run_id TEXT NOT NULL, genre TEXT NOT NULL, year INTEGER NOT NULL, response TEXT, "
+            "PRIMARY KEY (run_id, genre, year)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS run_users ("
+            "run_id TEXT NOT NULL, user_id INTEGER NOT NULL, queries TEXT NOT NULL, "
+            "status INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (run_id, user_id)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sent_movies ("
+            "user_id INTEGER NOT NULL, movie_id INTEGER NOT NULL, sent_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, movie_id)) WITHOUT ROWID"
+        )
+
+    def subscribe(self, user_id: int, genres: Sequence[str] = ()) -> None:
+        """
+        :param genres: Жанры в API; пустой список - жанры берутся из истории пользователя.
+        """
+        self._db.execute(
+            "INSERT OR REPLACE INTO subscriptions (user_id, genres) VALUES (?, ?)", (user_id, ",".join(genres))
+        )
+
+    def unsubscribe(self, user_id: int) -> bool:
+
+        return self._db.execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,)).rowcount > 0
+
+    def subscriptions(self) -> List[Tuple[int, List[str]]]:
+
+        return [
+            (user_id, [genre for genre in genres.split(",") if genre])
+            for user_id, genres in self._db.execute("SELECT user_id, genres FROM subscriptions ORDER BY user_id")
+        ]
+
+    def claim(self, run_id: str, owner: str, lease: float) -> Optional[bool]:
+        """
+        Захватывает рассылку или продлевает захват.
+
+        :return: None - рассылка уже завершена или ее выполняет другой процесс;
+                 иначе признак того, что подписчики уже распределены по запросам.
+        """
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT owner, lease_until, planned, finished_at FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                self._db.execute(
+                    "INSERT INTO runs (run_id, owner, lease_until, started_at) VALUES (?, ?, ?, ?)",
+                    (run_id, owner, now + lease, now)
+                )
+                planned: Optional[bool] = False
+            elif row[3] is not None or (row[0] != owner and row[1] > now):
+                planned = None
+            else:
+                self._db.execute(
+                    "UPDATE runs SET owner = ?, lease_until = ? WHERE run_id = ?", (owner, now + lease, run_id)
+                )
+                planned = bool(row[2])
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return planned
+
+    def save_plan(self, run_id: str, users: Dict[int, List[Query]]) -> None:
+        """
+        Сохраняет запросы подписчиков и список различных запросов рассылки одной транзакцией.
+        """
+        queries = {query for user_queries in users.values() for query in user_queries}
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO run_queries (run_id, genre, year) VALUES (?, ?, ?)",
+                [(run_id, genre, year) for genre, year in sorted(queries)]
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO run_users (run_id, user_id, queries) VALUES (?, ?, ?)",
+                [(run_id, user_id, json.dumps(user_queries)) for user_id, user_queries in users.items()]
+            )
+            self._db.execute("UPDATE runs SET planned = 1 WHERE run_id = ?", (run_id,))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def pending_queries(self, run_id: str) -> List[Query]:
+
+        return [
+            (genre, year) for genre, year in self._db.execute(
+                "SELECT genre, year FROM run_queries WHERE run_id = ? AND response IS NULL", (run_id,)
+            )
+        ]
+
+    def save_response(self, run_id: str, query: Query, response: Dict[str, Any]) -> None:
+
+        self._db.execute(
+            "UPDATE run_queries SET response = ? WHERE run_id = ? AND genre = ? AND year = ?",
+            (json.dumps(response, ensure_ascii=False, default=encode_movie), run_id, *query)
+        )
+
+    def responses(self, run_id: str) -> Dict[Query, Dict[str, Any]]:
+
+        return {
+            (genre, year): parse_response(json.loads(response))
+            for genre, year, response in self._db.execute(
+                "SELECT genre, year, response FROM run_queries WHERE run_id = ? AND response IS NOT NULL", (run_id,)
+            )
+        }
+
+    def pending_users(self, run_id: str) -> List[Tuple[int, List[Query]]]:
+
+        return [
+            (user_id, [(genre, year) for genre, year in json.loads(queries)])
+            for user_id, queries in self._db.execute(
+                "SELECT user_id, queries FROM run_users WHERE run_id = ? AND status = ? ORDER BY queries, user_id",
+                (run_id, PENDING)
+            )
+        ]
+
+    def mark_user(self, run_id: str, user_id: int, status: int) -> None:
+
+        self._db.execute(
+            "UPDATE run_users SET status = ? WHERE run_id = ? AND user_id = ?", (status, run_id, user_id)
+        )
+
+    def mark_sent(self, run_id: str, user_id: int, movie_ids: Sequence[int]) -> None:
+        """
+        Отмечает подборку отправленной и запоминает ее фильмы одной транзакцией.
+        """
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sent_movies (user_id, movie_id, sent_at) VALUES (?, ?, ?)",
+                [(user_id, movie_id, now) for movie_id in movie_ids]
+            )
+            self.mark_user(run_id, user_id, SENT)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def sent_movies(self, user_id: int) -> Set[int]:
+        """
+        Фильмы, которые уже были в подборках пользователя.
+        """
+        return {
+            movie_id for movie_id, in self._db.execute("SELECT movie_id FROM sent_movies WHERE user_id = ?", (user_id,))
+        }
+
+    def forget_sent(self, before: float) -> None:
+        """
+        Удаляет отметки об отправке старше before: такие фильмы уже не попадают в новинки.
+        """
+        self._db.execute("DELETE FROM sent_movies WHERE sent_at < ?", (before,))
+
+    def finish(self, run_id: str) -> None:
+
+        self._db.execute("UPDATE runs SET finished_at = ?, owner = NULL WHERE run_id = ?", (time.time(), run_id))
+
+    def status(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Последние рассылки: число запросов, выполненных запросов и получателей по состояниям.
+        """
+        runs = self._db.execute(
+            "SELECT run_id, started_at, finished_at FROM runs ORDER BY run_id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        result = []
+        for run_id, started_at, finished_at in runs:
+            queries, fetched = self._db.execute(
+                "SELECT COUNT(*), COUNT(response) FROM run_queries WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            users = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM run_users WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall())
+            result.append({
+                "run_id": run_id,
+                "started_at": started_at,
+                "finished_at": finished_at,
+                "queries": queries,
+                "fetched": fetched,
+                "pending": users.get(PENDING, 0),
+                "sent": users.get(SENT, 0),
+                "skipped": users.get(SKIPPED, 0),
+            })
+        return result
+
+    def close(self) -> None:
+
+        self._db.close()
+
+
+_store: Optional[DigestStore] = None
+
+def get_store() -> DigestStore:
+    """
+    Возвращает базу подписок, открывая ее при первом обращении.
+    """
+    global _store
+    if _store is None:
+        _store = DigestStore(DIGEST_DB_PATH)
+    return _store
+
+
+def plan_queries(subscriptions: List[Tuple[int, List[str]]], years: Sequence[int]) -> Dict[int, List[Query]]:
+    """
+    Запросы каждого подписчика: его жанры (заданные или любимые по истории) за каждый год.
+    Подписчики без известных жанров пропускаются.
+    """
+    users: Dict[int, List[Query]] = {}
+    for user_id, genres in subscriptions:
+        chosen = genres or get_favourite_genres(user_id, DIGEST_GENRES)
+        normalized = sorted({genre for genre in map(normalize_genre, chosen) if genre})
+        if normalized:
+            users[user_id] = [(genre, year) for genre in normalized for year in years]
+    return users
+
+
+async def fetch_queries(
+    store: DigestStore,
+    run_id: str,
+    fetch: Callable[[str, int], Awaitable[Dict[str, Any]]],
+    concurrency: int,
+    renew: Callable[[], bool],
+) -> int:
+    """
+    Выполняет еще не выполненные запросы рассылки, не больше concurrency одновременно.
+    Каждый ответ сразу сохраняется; запросы с ошибкой повторятся при продолжении рассылки.
+
+    :param renew: Продлевает захват рассылки; False - рассылку перехватил другой процесс.
+    :return: Количество выполненных запросов.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    fetched = 0
+
+    async def run(query: Query) -> None:
+        nonlocal fetched
+        async with semaphore:
+            if not renew():
+                return
+            response = await fetch(*query)
+        if "error" in response:
+            logger.warning("Запрос подборки %s не выполнен: %s", query, response["error"])
+            return
+        store.save_response(run_id, query, response)
+        fetched += 1
+
+    await asyncio.gather(*(run(query) for query in store.pending_queries(run_id)))
+    return fetched
+
+
+def rank_candidates(queries: List[Query], responses: Dict[Query, Dict[str, Any]]) -> List[Movie]:
+    """
+    Фильмы из ответов на запросы подписчика без повторов, лучшие по рейтингу первыми.
+    """
+    movies: Dict[int, Movie] = {}
+    for query in queries:
+        for movie in (responses.get(query) or {}).get("docs") or []:
+            if movie.id is not None and movie.name:
+                movies.setdefault(movie.id, movie)
+    return sorted(movies.values(), key=lambda movie: movie.rating or 0, reverse=True)
+
+
+def compose_digest(movies: Sequence[Movie]) -> Optional[str]:
+    """
+    Текст подборки. Названия выводятся вне entity разметки: в Markdown Telegram
+    экранирование внутри *...* не работает. Фильмы, которые не помещаются
+    в сообщение, отбрасываются целиком.
+
+    :return: Markdown-текст или None, если показывать нечего.
+    """
+    header = "*Новинки в ваших любимых жанрах*\n\n"
+    footer = "\nОтписаться от подборки: /digest off"
+    lines = []
+    length = len(header) + len(footer)
+    for movie in movies:
+        details = ", ".join(
+            part for part in (movie.year and str(movie.year), movie.rating and f"IMDb {movie.rating}") if part
+        )
+        line = escape_markdown(movie.name) + (f" _({details})_" if details else "")
+        line += f"\n{escape_markdown(', '.join(movie.genres))}\n" if movie.genres else "\n"
+        if length + len(line) > MESSAGE_LIMIT:
+            break
+        lines.append(line)
+        length += len(line)
+    if not lines:
+        return None
+    return header + "".join(lines) + footer
+
+
+async def deliver(
+    store: DigestStore,
+    run_id: str,
+    send: Callable[[int, str], Awaitable[Any]],
+    concurrency: int,
+    renew: Callable[[], bool],
+) -> Dict[str, int]:
+    """
+    Отправляет подборки получателям, которым они еще не отправлены. Кандидаты
+    ранжируются один раз на группу подписчиков с одинаковыми запросами; из них
+    выбираются фильмы, которых еще не было в подборках получателя, и текст строится
+    один раз на каждый такой набор. Состояние получателя и отправленные фильмы
+    сохраняются сразу после отправки.
+
+    :param send: Отправка сообщения в чат.
+    :return: Количество отправленных, пропущенных и неотправленных подборок.
+    """
+    responses = store.responses(run_id)
+    candidates: Dict[str, List[Movie]] = {}
+    texts: Dict[Tuple[int, ...], Optional[str]] = {}
+    counts = {"sent": 0, "skipped": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(user_id: int, queries: List[Query]) -> None:
+        if any(query not in responses for query in queries):
+            # Подборка отправится, когда при продолжении рассылки выполнятся все ее запросы
+            counts["failed"] += 1
+            return
+        group = json.dumps(queries)
+        if group not in candidates:
+            candidates[group] = rank_candidates(queries, responses)
+        sent = store.sent_movies(user_id)
+        movies = [movie for movie in candidates[group] if movie.id not in sent][:DIGEST_MOVIES]
+        selection = tuple(movie.id for movie in movies)
+        if selection not in texts:
+            texts[selection] = compose_digest(movies)
+        text = texts[selection]
+        if text is None:
+            store.mark_user(run_id, user_id, SKIPPED)
+            counts["skipped"] += 1
+            return
+        async with semaphore:
+            if not renew():
+                return
+            try:
+                await send(user_id, text)
+            except (TelegramForbiddenError, TelegramBadRequest) as error:
+                # Бот заблокирован или чата больше нет: повторная отправка не поможет
+                logger.log(
+                    logging.INFO if isinstance(error, TelegramForbiddenError) else logging.WARNING,
+                    "Подборка для %s не отправлена: %s", user_id, error
+                )
+                store.mark_user(run_id, user_id, SKIPPED)
+                if isinstance(error, TelegramForbiddenError):
+                    store.unsubscribe(user_id)
+                counts["skipped"] += 1
+                return
+            except Exception:
+                logger.warning("Подборка для %s не отправлена", user_id, exc_info=True)
+                counts["failed"] += 1
+                return
+        store.mark_sent(run_id, user_id, selection)
+        counts["sent"] += 1
+
+    # Массовая рассылка уступает очередь ответам пользователям
+    with bulk_sends():
+        await asyncio.gather(*(run(user_id, queries) for user_id, queries in store.pending_users(run_id)))
+    return counts
+
+
+async def run_digest(bot: Bot, run_id: Optional[str] = None, store: Optional[DigestStore] = None) -> Optional[Dict[str, int]]:
+    """
+    Выполняет рассылку или продолжает прерванную.
+
+    :param run_id: Идентификатор рассылки; по умолчанию сегодняшняя дата.
+    :return: Итоги рассылки или None, если она уже завершена или ее выполняет другой процесс.
+    """
+    from kinopoisk_api import search_new_movies_by_genre
+
+    store = store or get_store()
+    run_id = run_id or date.today().isoformat()
+    owner = f"{os.getpid()}:{id(store)}"
+    planned = store.claim(run_id, owner, DIGEST_LEASE)
+    if planned is None:
+        return None
+
+    renewed = time.monotonic()
+
+    def renew() -> bool:
+        # Захват продлевается, когда прошла треть срока, а не перед каждым запросом
+        nonlocal renewed
+        if time.monotonic() - renewed < DIGEST_LEASE / 3:
+            return True
+        renewed = time.monotonic()
+        return store.claim(run_id, owner, DIGEST_LEASE) is not None
+
+    if not planned:
+        year = date.today().year
+        users = plan_queries(store.subscriptions(), [year - offset for offset in range(DIGEST_YEARS)])
+        store.save_plan(run_id, users)
+        logger.info(
+            "Подборка %s: %d подписчиков, %d групп, %d запросов", run_id, len(users),
+            len({tuple(queries) for queries in users.values()}), len(store.pending_queries(run_id))
+        )
+
+    fetched = await fetch_queries(
+        store, run_id,
+        lambda genre, year: search_new_movies_by_genre(genre, year, limit=DIGEST_CANDIDATES),
+        DIGEST_FETCH_CONCURRENCY, renew,
+    )
+    counts = await deliver(
+        store, run_id,
+        lambda user_id, text: bot.send_message(user_id, text, parse_mode='Markdown'),
+        DIGEST_SEND_CONCURRENCY, renew,
+    )
+    counts["fetched"] = fetched
+    if store.claim(run_id, owner, DIGEST_LEASE) is not None and not store.pending_users(run_id):
+        store.finish(run_id)
+        # Фильмы прошлых лет выпуска в подборки больше не попадут
+        store.forget_sent(time.time() - (DIGEST_YEARS + 1) * 366 * 24 * 3600)
+    logger.info("Подборка %s: %s", run_id, counts)
+    return counts
+
+
+async def digest_scheduler(bot: Bot, hour: int = DIGEST_HOUR) -> None:
+    """
+    Фоновая задача бота: при запуске продолжает сегодняшнюю рассылку, если она
+    не завершена, затем выполняет рассылку каждый день в указанный час.
+    """
+    while True:
+        now = datetime.now()
+        if now.hour >= hour:
+            try:
+                await run_digest(bot)
+            except Exception:
+                logger.exception("Рассылка подборки не выполнена")
+            # Незавершенная рассылка (ошибки API или отправки) продолжится через DIGEST_LEASE
+            finished = all(run["finished_at"] for run in get_store().status(1))
+            next_run = (now + timedelta(days=1)).replace(hour=hour, minute=0, second=0, microsecond=0)
+            delay = (next_run - datetime.now()).total_seconds() if finished else DIGEST_LEASE
+        else:
+            delay = (now.replace(hour=hour, minute=0, second=0, microsecond=0) - now).total_seconds()
+        await asyncio.sleep(max(delay, 1.0))
+
+
+async def _run(run_id: Optional[str]) -> Optional[Dict[str, int]]:
+
+    from bot import bot
+    from kinopoisk_api import close_session
+
+    try:
+        return await run_digest(bot, run_id)
+    finally:
+        await close_session()
+        await bot.session.close()
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Подборка новинок в любимых жанрах подписчиков")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="выполнить или продолжить рассылку")
+    run_parser.add_argument("--run-id", help="идентификатор рассылки, по умолчанию сегодняшняя дата")
+    commands.add_parser("status", help="состояние последних рассылок")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "run":
+        counts = asyncio.run(_run(args.run_id))
+        print(f"Итоги рассылки: {counts}" if counts is not None else "Рассылка уже завершена или выполняется")
+    else:
+        for run in get_store().status():
+            print(
+                f"{run['run_id']}: запросов {run['fetched']}/{run['queries']}, отправлено {run['sent']}, "
+                f"пропущено {run['skipped']}, ожидает {run['pending']}"
+                f"{'' if run['finished_at'] else ', не завершена'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config import FSM_DB_PATH, FSM_REDIS_URL
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM в SQLite. Состояние и данные сериализуются в JSON,
+    поэтому в данных допустимы только простые значения (строки, числа, списки, словари).
+    Несколько процессов могут работать с одним файлом базы (режим WAL).
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS fsm ("
+                "key TEXT PRIMARY KEY, state TEXT, data TEXT)"
+            )
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+
+        value = state.state if isinstance(state, State) else state
+        with self._db:
+            self._db.execute(
+                "INSERT INTO fsm (key, state) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+                (self._key(key), value)
+            )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+
+        row = self._db.execute("SELECT state FROM fsm WHERE key = ?", (self._key(key),)).fetchone()
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+
+        value = json.dumps(data, ensure_ascii=False) if data else None
+        with self._db:
+            self._db.execute(
+                "INSERT INTO fsm (key, data) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+                (self._key(key), value)
+            )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+
+        row = self._db.execute("SELECT data FROM fsm WHERE key = ?", (self._key(key),)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    async def close(self) -> None:
+
+        self._db.close()
+
+
+def create_storage() -> BaseStorage:
+    """
+    Создает хранилище FSM: Redis, если задан FSM_REDIS_URL, иначе SQLite.
+    """
+    if FSM_REDIS_URL:
+        # Redis нужен только для развертывания с несколькими серверами, пакет redis необязателен
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(FSM_REDIS_URL)
+    return SQLiteStorage(FSM_DB_PATH)
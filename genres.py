@@ -0,0 +1,93 @@
+from typing import Dict, List, Optional, Tuple
+
+# Пункты меню жанров и соответствующие названия жанров в API КиноПоиск
+GENRES: List[Tuple[str, str]] = [
+    ("Комедии", "комедия"),
+    ("Мультфильмы", "мультфильм"),
+    ("Ужасы", "ужасы"),
+    ("Фантастика", "фантастика"),
+    ("Триллеры", "триллер"),
+    ("Боевики", "боевик"),
+    ("Мелодрамы", "мелодрама"),
+    ("Детективы", "детектив"),
+    ("Приключения", "приключения"),
+    ("Фэнтези", "фэнтези"),
+    ("Военные", "военный"),
+    ("Семейные", "семейный"),
+    ("Аниме", "аниме"),
+    ("Исторические", "история"),
+    ("Драмы", "драма"),
+    ("Документальные", "документальный"),
+    ("Детские", "детский"),
+    ("Криминал", "криминал"),
+    ("Биографии", "биография"),
+    ("Вестерны", "вестерн"),
+    ("Фильмы-нуар", "фильм-нуар"),
+    ("Спортивные", "спорт"),
+    ("Реальное ТВ", "реальное ТВ"),
+    ("Короткометражки", "короткометражка"),
+    ("Музыкальные", "музыка"),
+    ("Мюзиклы", "мюзикл"),
+    ("Ток-шоу", "ток-шоу"),
+    ("Игры", "игра"),
+]
+
+# Другие формы и частые опечатки
+_ALIASES: Dict[str, List[str]] = {
+    "комедия": ["комедию", "комедийный", "комедийные", "коммедия", "коммедии", "камедия", "камедии"],
+    "мультфильм": ["мульт", "мульты", "мультик", "мультики", "мультфилм", "мультфилмы", "анимация"],
+    "ужасы": ["ужас", "ужастик", "ужастики", "хоррор", "хорор"],
+    "фантастика": ["фантастический", "фантастические", "фантастика", "фонтастика", "sci-fi"],
+    "триллер": ["трилер", "трилеры"],
+    "боевик": ["боевики", "экшн", "экшен"],
+    "мелодрама": ["мелодрамма", "мелодраммы", "романтика"],
+    "детектив": ["детективы", "дэтектив"],
+    "приключения": ["приключение", "приключенческий", "приключенческие", "приключеня"],
+    "фэнтези": ["фентези", "фэнтэзи", "фэнтази", "фентэзи"],
+    "военный": ["военные", "военное", "война", "про войну"],
+    "семейный": ["семейные", "семейное", "для всей семьи"],
+    "аниме": ["анимэ"],
+    "история": ["исторические", "исторический", "историческое"],
+    "драма": ["драмы", "драмма"],
+    "документальный": ["документальные", "документалка", "документальное", "документалки"],
+    "детский": ["детские", "детское", "для детей"],
+    "криминал": ["криминальный", "криминальные", "криминалы"],
+    "биография": ["биографии", "биографический", "биографические", "байопик"],
+    "вестерн": ["вестерны", "вестэрн"],
+    "фильм-нуар": ["фильмы-нуар", "нуар", "фильм нуар"],
+    "спорт": ["спортивные", "спортивный"],
+    "реальное ТВ": ["реалити", "реалити-шоу"],
+    "короткометражка": ["короткометражки", "короткометражный", "короткий метр"],
+    "музыка": ["музыкальные", "музыкальный"],
+    "мюзикл": ["мюзиклы", "мьюзикл"],
+    "ток-шоу": ["ток шоу", "токшоу"],
+    "игра": ["игры"],
+}
+
+
+def _normalize(text: str) -> str:
+
+    return " ".join(text.casefold().replace("ё", "е").replace("-", " ").split())
+
+
+def _build_lookup() -> Dict[str, str]:
+
+    lookup: Dict[str, str] = {}
+    for label, genre in GENRES:
+        for variant in (label, genre, *_ALIASES.get(genre, [])):
+            lookup[_normalize(variant)] = genre
+    return lookup
+
+
+# Таблица строится один раз при импорте, поиск по ней - O(1)
+GENRE_LOOKUP: Dict[str, str] = _build_lookup()
+
+
+def normalize_genre(text: str) -> Optional[str]:
+    """
+    Возвращает название жанра в API по пункту меню, форме слова или опечатке.
+
+    :param text: Жанр, введенный пользователем.
+    :return: Название жанра в API или None, если жанр не распознан.
+    """
+    return GENRE_LOOKUP.get(_normalize(text))
@@ -1,44 +1,374 @@
+import asyncio
 import json
-from typing import List, Dict, Union
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, List, Dict, Optional, Tuple, Union
+
+from config import HISTORY_DB_PATH, HISTORY_LEGACY_USER_ID, HISTORY_FLUSH_INTERVAL, HISTORY_FLUSH_BATCH
+from metrics import HISTORY_LATENCY
 
 HISTORY_FILE = "history.json"
 
-def load_history() -> List[Dict[str, Union[str, int, bool]]]:
-    
+logger = logging.getLogger(__name__)
+
+# Формат даты, в котором история показывается пользователю
+DATE_FORMAT = "%d-%m-%Y %H:%M:%S"
+# Сортируемый формат для индекса по дате
+ISO_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+HistoryEntry = Dict[str, Union[str, int, bool, None]]
+
+_COLUMNS = (
+    "movie_id", "user_id", "searched_at", "date", "title", "description",
+    "rating", "year", "genre", "age_rating", "poster", "watched"
+)
+
+_INSERT_SQL = f"INSERT INTO history ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})"
+_MARK_SQL = "UPDATE history SET watched = ? WHERE user_id = ? AND movie_id = ?"
+
+_SEEN_SQL = (
+    "SELECT * FROM history WHERE entry_id IN ("
+    "SELECT MAX(entry_id) FROM history WHERE movie_id IS NOT NULL GROUP BY movie_id"
+    ") ORDER BY entry_id DESC LIMIT ?"
+)
+
+_connection: Optional[sqlite3.Connection] = None
+# Соединение может открываться прогревом в рабочем потоке одновременно с первым запросом
+_connection_lock = threading.Lock()
+
+# Очередь отложенной записи: операции (SQL, параметры) в порядке поступления
+_pending: List[Tuple[str, tuple]] = []
+_writer: Optional["asyncio.Task[None]"] = None
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Возвращает соединение с базой истории, при первом вызове создает схему
+    и переносит записи из history.json.
+    """
+    global _connection
+    if _connection is not None:
+        return _connection
+    with _connection_lock:
+        if _connection is None:
+            connection = sqlite3.connect(HISTORY_DB_PATH, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            _create_schema(connection)
+            migrate_from_json(connection)
+            _connection = connection
+    return _connection
+
+def close_connection() -> None:
+    """
+    Записывает отложенные операции, переносит журнал WAL в основной файл базы
+    и закрывает соединение.
+    """
+    global _connection
+    flush()
+    if _connection is not None:
+        _connection.execute("PRAGMA wal_checkpoint(FULL)")
+        _connection.close()
+        _connection = None
+
+@HISTORY_LATENCY.time(operation="flush")
+def _flush_pending() -> None:
+
+    connection = get_connection()
+    with connection:
+        # Подряд идущие операции одного вида выполняются одним executemany
+        start = 0
+        for index in range(1, len(_pending) + 1):
+            if index == len(_pending) or _pending[index][0] != _pending[start][0]:
+                connection.executemany(_pending[start][0], [params for _, params in _pending[start:index]])
+                start = index
+    # Очередь очищается только после фиксации: при ошибке операции будут записаны при следующей попытке
+    del _pending[:]
+
+def flush() -> None:
+    """
+    Записывает накопленные операции одной транзакцией.
+    """
+    if _pending:
+        _flush_pending()
+
+def _write(sql: str, rows: Iterable[tuple]) -> None:
+
+    if _writer is None:
+        # Фоновая запись не запущена (скрипты, миграция): пишем сразу
+        with get_connection() as connection:
+            connection.executemany(sql, rows)
+        return
+    _pending.extend((sql, row) for row in rows)
+    if len(_pending) >= HISTORY_FLUSH_BATCH:
+        flush()
+
+async def _write_behind(interval: float) -> None:
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            flush()
+        except sqlite3.Error as e:
+            logger.error("Ошибка записи истории: %r", e)
+
+def start_writer(interval: float = HISTORY_FLUSH_INTERVAL) -> None:
+    """
+    Включает отложенную запись: добавление в историю и отметки просмотра копятся
+    в памяти и записываются пачкой раз в interval секунд или по достижении
+    HISTORY_FLUSH_BATCH операций. Чтение истории сначала записывает накопленное.
+    """
+    global _writer
+    if _writer is None:
+        _writer = asyncio.get_running_loop().create_task(_write_behind(interval))
+
+async def stop_writer() -> None:
+    """
+    Останавливает фоновую запись и записывает все накопленные операции.
+    """
+    global _writer
+    if _writer is not None:
+        _writer.cancel()
+        try:
+            await _writer
+        except asyncio.CancelledError:
+            pass
+        _writer = None
+    flush()
+
+def writer_stats() -> Dict[str, int]:
+    """
+    Метрики отложенной записи: число операций в очереди.
+    """
+    return {"pending": len(_pending), "running": int(_writer is not None)}
+
+def _create_schema(connection: sqlite3.Connection) -> None:
+
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "entry_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "movie_id INTEGER, "
+            "user_id INTEGER, "
+            "searched_at TEXT NOT NULL, "
+            "date TEXT NOT NULL, "
+            "title TEXT, "
+            "description TEXT, "
+            "rating, "
+            "year, "
+            "genre TEXT, "
+            "age_rating, "
+            "poster TEXT, "
+            "watched INTEGER NOT NULL DEFAULT 0)"
+        )
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_history_searched_at ON history (searched_at)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_history_movie_id ON history (movie_id)")
+        # Составные индексы для выборок в пределах одного пользователя
+        connection.execute("DROP INDEX IF EXISTS idx_history_user_id")
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_history_user_date ON history (user_id, searched_at)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_history_user_movie ON history (user_id, movie_id)"
+        )
+        # Записи, перенесенные без владельца, передаются указанному пользователю
+        if HISTORY_LEGACY_USER_ID is not None:
+            connection.execute(
+                "UPDATE history SET user_id = ? WHERE user_id IS NULL", (HISTORY_LEGACY_USER_ID,)
+            )
+
+def _to_row(movie: HistoryEntry, user_id: Optional[int]) -> tuple:
+
+    date = str(movie.get("date") or datetime.now().strftime(DATE_FORMAT))
+    searched_at = datetime.strptime(date, DATE_FORMAT).strftime(ISO_FORMAT)
+    return (
+        movie.get("id"),
+        user_id if user_id is not None else movie.get("user_id"),
+        searched_at,
+        date,
+        movie.get("title"),
+        movie.get("description"),
+        movie.get("rating"),
+        movie.get("year"),
+        movie.get("genre"),
+        movie.get("age_rating"),
+        movie.get("poster"),
+        int(bool(movie.get("watched", False))),
+    )
+
+def _to_entry(row: sqlite3.Row) -> HistoryEntry:
+
+    return {
+        "id": row["movie_id"],
+        "user_id": row["user_id"],
+        "date": row["date"],
+        "title": row["title"],
+        "description": row["description"],
+        "rating": row["rating"],
+        "year": row["year"],
+        "genre": row["genre"],
+        "age_rating": row["age_rating"],
+        "poster": row["poster"],
+        "watched": bool(row["watched"]),
+    }
+
+def migrate_from_json(connection: sqlite3.Connection, json_path: str = HISTORY_FILE) -> int:
+    """
+    Однократно переносит записи из history.json в базу. Перенос и отметка о нем
+    в meta выполняются одной транзакцией BEGIN IMMEDIATE, поэтому процессы, которые
+    открывают базу одновременно (воркеры webhook), не перенесут записи дважды.
+    Сам файл не изменяется.
+
+    :return: Количество перенесенных записей.
+    """
+    if not os.path.exists(json_path):
+        return 0
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        if connection.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone() is not None:
+            connection.rollback()
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as file:
+                history = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # Файл мог удалить другой процесс или он поврежден: переносить нечего
+            history = []
+        connection.executemany(_INSERT_SQL, [_to_row(movie, HISTORY_LEGACY_USER_ID) for movie in history])
+        connection.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (datetime.now().isoformat(),))
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    return len(history)
+
+@HISTORY_LATENCY.time(operation="add")
+def add_to_history(user_id: int, movie: HistoryEntry) -> None:
+
+    _write(_INSERT_SQL, [_to_row(movie, user_id)])
+
+@HISTORY_LATENCY.time(operation="add_many")
+def add_many_to_history(user_id: int, movies: List[HistoryEntry]) -> None:
+    """
+    Добавляет в историю пользователя целую страницу результатов одной транзакцией.
+    """
+    if movies:
+        _write(_INSERT_SQL, [_to_row(movie, user_id) for movie in movies])
+
+@HISTORY_LATENCY.time(operation="range")
+def get_history_range(
+    user_id: int,
+    start: datetime,
+    end: datetime,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> List[HistoryEntry]:
+    """
+    Возвращает записи истории пользователя в полуинтервале [start, end).
+    Выборка идет по индексу (user_id, searched_at).
+
+    :param offset: Сколько записей пропустить.
+    :param limit: Максимальное количество записей; None - все.
+    """
+    flush()
+    rows = get_connection().execute(
+        "SELECT * FROM history WHERE user_id = ? AND searched_at >= ? AND searched_at < ? "
+        "ORDER BY searched_at, entry_id LIMIT ? OFFSET ?",
+        (user_id, start.strftime(ISO_FORMAT), end.strftime(ISO_FORMAT), -1 if limit is None else limit, offset)
+    ).fetchall()
+    return [_to_entry(row) for row in rows]
+
+@HISTORY_LATENCY.time(operation="count")
+def count_history_range(user_id: int, start: datetime, end: datetime) -> int:
+    """
+    Возвращает количество записей истории пользователя в полуинтервале [start, end).
+    """
+    flush()
+    return get_connection().execute(
+        "SELECT COUNT(*) FROM history WHERE user_id = ? AND searched_at >= ? AND searched_at < ?",
+        (user_id, start.strftime(ISO_FORMAT), end.strftime(ISO_FORMAT))
+    ).fetchone()[0]
+
+def _day_bounds(date_str: str) -> Tuple[datetime, datetime]:
+
+    day = datetime.strptime(date_str, "%d-%m-%Y")
+    return day, day + timedelta(days=1)
+
+def get_history_by_date(user_id: int, date_str: str, offset: int = 0, limit: Optional[int] = None) -> List[HistoryEntry]:
+    """
+    Возвращает записи истории пользователя за день в формате ДД-ММ-ГГГГ.
+    """
+    return get_history_range(user_id, *_day_bounds(date_str), offset=offset, limit=limit)
+
+def count_history_by_date(user_id: int, date_str: str) -> int:
+    """
+    Возвращает количество записей истории пользователя за день в формате ДД-ММ-ГГГГ.
+    """
+    return count_history_range(user_id, *_day_bounds(date_str))
+
+@HISTORY_LATENCY.time(operation="mark_watched")
+def mark_movie_as_watched(user_id: int, movie_id: int, watched: bool) -> None:
+
+    _write(_MARK_SQL, [(int(watched), user_id, int(movie_id))])
+
+@HISTORY_LATENCY.time(operation="seen_movies")
+def get_seen_movies(limit: int) -> List[HistoryEntry]:
+    """
+    Возвращает последние записи о разных фильмах из истории всех пользователей.
+    """
+    flush()
+    rows = get_connection().execute(_SEEN_SQL, (limit,)).fetchall()
+    return [_to_entry(row) for row in rows]
+
+def read_seen_movies(limit: int) -> List[HistoryEntry]:
+    """
+    То же, что get_seen_movies, но через отдельное соединение и без записи очереди:
+    можно вызывать из рабочего потока, отложенные записи в результат не попадают.
+    """
+    get_connection()
+    connection = sqlite3.connect(HISTORY_DB_PATH)
+    connection.row_factory = sqlite3.Row
     try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-       
-        return []
-
-def save_history(history: List[Dict[str, Union[str, int, bool]]]) -> None:
-    
-    with open(HISTORY_FILE, "w", encoding="utf-8") as file:
-        json.dump(history, file, ensure_ascii=False, indent=4)
-
-def add_to_history(movie: Dict[str, Union[str, int, bool]]) -> None:
-    
-    history = load_history()
-    history.append(movie)
-    save_history(history)
-
-def get_history_by_date(date_str: str) -> List[Dict[str, Union[str, int, bool]]]:
-    
-    history = load_history()
-    filtered_history = [entry for entry in history if entry["date"].startswith(date_str)]
-    return filtered_history
-
-def mark_movie_as_watched(movie_id: int, watched: bool) -> None:
-    
-    
-    history = load_history()
-    
-    
-    for entry in history:
-        if entry['id'] == movie_id:
-            entry['watched'] = watched
-            break
-    
-   
-    save_history(history)
+        rows = connection.execute(_SEEN_SQL, (limit,)).fetchall()
+    finally:
+        connection.close()
+    return [_to_entry(row) for row in rows]
+
+@HISTORY_LATENCY.time(operation="watched_movies")
+def get_watched_movies(user_id: int) -> List[HistoryEntry]:
+    """
+    Возвращает по одной записи на каждый фильм, отмеченный пользователем как просмотренный.
+    """
+    flush()
+    rows = get_connection().execute(
+        "SELECT * FROM history WHERE entry_id IN ("
+        "SELECT MAX(entry_id) FROM history WHERE user_id = ? AND movie_id IS NOT NULL AND watched = 1 "
+        "GROUP BY movie_id)",
+        (user_id,)
+    ).fetchall()
+    return [_to_entry(row) for row in rows]
+
+@HISTORY_LATENCY.time(operation="favourite_genres")
+def get_favourite_genres(user_id: int, limit: int) -> List[str]:
+    """
+    Самые частые жанры фильмов, отмеченных пользователем как просмотренные,
+    а если таких нет - всех показанных ему фильмов.
+    """
+    flush()
+    rows = get_connection().execute(
+        "SELECT genre, watched FROM history WHERE user_id = ? AND genre IS NOT NULL AND genre != ''",
+        (user_id,)
+    ).fetchall()
+    watched: Counter = Counter()
+    shown: Counter = Counter()
+    for row in rows:
+        genres = [name.strip() for name in row["genre"].split(",") if name.strip()]
+        shown.update(genres)
+        if row["watched"]:
+            watched.update(genres)
+    return [genre for genre, _ in (watched or shown).most_common(limit)]
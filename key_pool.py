@@ -0,0 +1,295 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых ключ временно выводится из ротации
+KEY_REJECT_STATUSES = frozenset({401, 403, 429})
+
+# Заголовки, в которых API может сообщать остаток квоты
+_REMAINING_HEADERS = ("X-RateLimit-Remaining", "RateLimit-Remaining")
+
+
+def key_id(key: str) -> str:
+    """
+    Идентификатор ключа для учета: сами ключи в базу не записываются.
+    """
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class _KeyState:
+    """
+    Счетчики ключа в памяти процесса.
+    """
+
+    __slots__ = ("day", "used", "remaining", "cooldown_until")
+
+    def __init__(self, day: str, used: int, remaining: Optional[int], cooldown_until: float) -> None:
+        self.day = day
+        self.used = used
+        self.remaining = remaining
+        self.cooldown_until = cooldown_until
+
+
+class KeyPool:
+    """
+    Пул ключей API КиноПоиск с учетом дневной квоты.
+
+    Каждый запрос получает наименее использованный за сутки ключ, который не на паузе
+    и не исчерпал квоту. Ключи, получившие 401/403/429, ставятся на паузу. Выбор ключа
+    выполняется по счетчикам в памяти, без обращения к базе. Раз в sync_interval секунд
+    накопленные запросы и ответы API записываются в SQLite в отдельном потоке, а счетчики
+    процесса обновляются из базы: так квоты общие для всех процессов бота, а блокировка
+    базы другим процессом не останавливает цикл событий. Между синхронизациями процессы
+    могут вместе израсходовать немного больше квоты, чем daily_limit.
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        db_path: str,
+        daily_limit: int = 0,
+        cooldown: float = 60.0,
+        invalid_cooldown: float = 3600.0,
+        sync_interval: float = 2.0,
+    ) -> None:
+        """
+        :param keys: Ключи API.
+        :param db_path: Путь к файлу SQLite со счетчиками.
+        :param daily_limit: Квота запросов на ключ в сутки; 0 - без ограничения.
+        :param cooldown: Пауза ключа после ответа 429 без Retry-After, в секундах.
+        :param invalid_cooldown: Пауза ключа после ответа 401/403, в секундах.
+        :param sync_interval: Как часто счетчики синхронизируются с базой, в секундах.
+        """
+        self.daily_limit = daily_limit
+        self.cooldown = cooldown
+        self.invalid_cooldown = invalid_cooldown
+        self.sync_interval = sync_interval
+        self._keys: Dict[str, str] = {key_id(key): key for key in keys if key}
+        self._ids: List[str] = list(self._keys)
+        self._in = f"({', '.join('?' for _ in self._ids)})"
+        # Транзакции открываются вручную, чтобы взять блокировку записи до чтения счетчиков
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=1)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS api_keys ("
+            "key_id TEXT PRIMARY KEY, day TEXT NOT NULL, used INTEGER NOT NULL DEFAULT 0, "
+            "remaining INTEGER, cooldown_until REAL NOT NULL DEFAULT 0, last_status INTEGER)"
+        )
+        self._db.executemany(
+            "INSERT OR IGNORE INTO api_keys (key_id, day) VALUES (?, ?)",
+            [(ident, date.today().isoformat()) for ident in self._ids]
+        )
+        # Соединение используется и из потока синхронизации
+        self._db_lock = threading.Lock()
+        self._closed = False
+
+        self._state: Dict[str, _KeyState] = {}
+        # Запросы и ответы, еще не записанные в базу
+        self._used: Dict[str, int] = {}
+        self._reports: Dict[str, Tuple[Optional[int], Optional[float], int]] = {}
+        self._synced_at = 0.0
+        self._sync_task: Optional["asyncio.Task[None]"] = None
+        self._apply(self._sync({}, {}))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _sync(
+        self, used: Dict[str, int], reports: Dict[str, Tuple[Optional[int], Optional[float], int]]
+    ) -> List[Tuple[str, str, int, Optional[int], float]]:
+        """
+        Записывает накопленные запросы и ответы одной транзакцией и возвращает
+        счетчики всех ключей из базы.
+        """
+        today = date.today().isoformat()
+        with self._db_lock:
+            if self._closed:
+                return []
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Квоты обнуляются с началом новых суток
+                self._db.execute(
+                    f"UPDATE api_keys SET day = ?, used = 0, remaining = NULL WHERE day != ? AND key_id IN {self._in}",
+                    (today, today, *self._ids)
+                )
+                self._db.executemany(
+                    "UPDATE api_keys SET used = used + ?, remaining = remaining - ? WHERE key_id = ?",
+                    [(count, count, ident) for ident, count in used.items()]
+                )
+                self._db.executemany(
+                    "UPDATE api_keys SET remaining = COALESCE(?, remaining), "
+                    "cooldown_until = MAX(cooldown_until, COALESCE(?, 0)), last_status = ? WHERE key_id = ?",
+                    [(remaining, cooldown_until, status, ident) for ident, (remaining, cooldown_until, status) in reports.items()]
+                )
+                rows = self._db.execute(
+                    f"SELECT key_id, day, used, remaining, cooldown_until FROM api_keys WHERE key_id IN {self._in}",
+                    self._ids
+                ).fetchall()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _apply(self, rows: List[Tuple[str, str, int, Optional[int], float]]) -> None:
+        """
+        Заменяет счетчики в памяти прочитанными из базы с учетом запросов,
+        сделанных процессом за время синхронизации.
+        """
+        for ident, day, used, remaining, cooldown_until in rows:
+            pending = self._used.get(ident, 0)
+            state = _KeyState(
+                day, used + pending, remaining - pending if remaining is not None else None, cooldown_until
+            )
+            report = self._reports.get(ident)
+            if report is not None:
+                if report[0] is not None:
+                    state.remaining = report[0]
+                state.cooldown_until = max(state.cooldown_until, report[1] or 0.0)
+            self._state[ident] = state
+        self._synced_at = time.monotonic()
+
+    def _schedule_sync(self) -> None:
+
+        if self._sync_task is not None or time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.sync()
+            return
+        self._sync_task = loop.create_task(self._sync_in_thread())
+
+    async def _sync_in_thread(self) -> None:
+
+        used, self._used = self._used, {}
+        reports, self._reports = self._reports, {}
+        try:
+            self._apply(await asyncio.to_thread(self._sync, used, reports))
+        except Exception:
+            # Несохраненные изменения запишутся при следующей синхронизации
+            for ident, count in used.items():
+                self._used[ident] = self._used.get(ident, 0) + count
+            for ident, report in reports.items():
+                self._reports.setdefault(ident, report)
+            self._synced_at = time.monotonic()
+            logger.warning("Не удалось синхронизировать счетчики ключей API", exc_info=True)
+        finally:
+            self._sync_task = None
+
+    def sync(self) -> None:
+        """
+        Синхронизирует счетчики с базой в текущем потоке (при остановке и вне цикла событий).
+        """
+        used, self._used = self._used, {}
+        reports, self._reports = self._reports, {}
+        self._apply(self._sync(used, reports))
+
+    def acquire(self) -> Optional[str]:
+        """
+        Выбирает ключ для запроса и сразу учитывает запрос в его квоте.
+
+        :return: Ключ или None, если все ключи на паузе или исчерпали квоту.
+        """
+        if not self._ids:
+            return None
+        self._schedule_sync()
+        today = date.today().isoformat()
+        now = time.time()
+        best: Optional[str] = None
+        for ident in self._ids:
+            state = self._state[ident]
+            if state.day != today:
+                state.day, state.used, state.remaining = today, 0, None
+            if state.cooldown_until > now:
+                continue
+            if self.daily_limit and state.used >= self.daily_limit:
+                continue
+            if state.remaining is not None and state.remaining <= 0:
+                continue
+            if best is None or (state.used, ident) < (self._state[best].used, best):
+                best = ident
+        if best is None:
+            return None
+        state = self._state[best]
+        state.used += 1
+        if state.remaining is not None:
+            state.remaining -= 1
+        self._used[best] = self._used.get(best, 0) + 1
+        return self._keys[best]
+
+    def report(self, key: str, status: int, headers: Mapping[str, str], retry_after: Optional[float] = None) -> None:
+        """
+        Учитывает ответ API: остаток квоты из заголовков и паузу ключа при отказе.
+
+        :param key: Ключ, с которым выполнен запрос.
+        :param status: HTTP-статус ответа.
+        :param headers: Заголовки ответа.
+        :param retry_after: Значение Retry-After в секундах, если есть.
+        """
+        remaining = None
+        for header in _REMAINING_HEADERS:
+            try:
+                remaining = int(headers[header])
+                break
+            except (KeyError, ValueError):
+                continue
+
+        if status == 429:
+            cooldown_until = time.time() + (retry_after if retry_after is not None else self.cooldown)
+        elif status in (401, 403):
+            cooldown_until = time.time() + self.invalid_cooldown
+        elif remaining is None:
+            # Обычный ответ без сведений о квоте: записывать нечего
+            return
+        else:
+            cooldown_until = None
+
+        ident = key_id(key)
+        state = self._state.get(ident)
+        if state is None:
+            return
+        if remaining is not None:
+            state.remaining = remaining
+        if cooldown_until is not None:
+            state.cooldown_until = max(state.cooldown_until, cooldown_until)
+        self._reports[ident] = (remaining, cooldown_until, status)
+        self._schedule_sync()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Метрики пула: количество ключей, доступных сейчас, и запросов за сутки.
+        """
+        today = date.today().isoformat()
+        now = time.time()
+        available = used = 0
+        for state in self._state.values():
+            if state.day != today:
+                available += state.cooldown_until <= now
+                continue
+            used += state.used
+            available += (
+                state.cooldown_until <= now
+                and (not self.daily_limit or state.used < self.daily_limit)
+                and (state.remaining is None or state.remaining > 0)
+            )
+        return {"keys": len(self._ids), "available": available, "used_today": used}
+
+    def close(self) -> None:
+        """
+        Записывает несохраненные счетчики и закрывает базу.
+        """
+        try:
+            self.sync()
+        finally:
+            with self._db_lock:
+                self._closed = True
+                self._db.close()
@@ -1,43 +1,315 @@
-import requests
-from typing import Dict, Union, Optional
-from config import KINOPOISK_API_KEY, KINOPOISK_BASE_URL
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Union, Optional
 
-def search_movies(title: str = "Spider-Man", page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
+import aiohttp
+
+from cache import ResponseCache
+from catalog import Catalog, get_catalog
+from genres import normalize_genre
+from title_index import title_index
+from movies import SELECT_FIELDS, encode_movie, parse_response
+from metrics import API_LATENCY, API_REQUESTS
+from resilience import RETRY_STATUSES, CircuitBreaker, backoff_delay, parse_retry_after
+from key_pool import KEY_REJECT_STATUSES, KeyPool
+from config import (
+    KINOPOISK_API_KEYS,
+    KINOPOISK_KEYS_DB_PATH,
+    KINOPOISK_KEY_DAILY_LIMIT,
+    KINOPOISK_KEY_COOLDOWN,
+    KINOPOISK_KEY_INVALID_COOLDOWN,
+    KINOPOISK_KEYS_SYNC_INTERVAL,
+    KINOPOISK_BASE_URL,
+    KINOPOISK_CONNECTION_LIMIT,
+    KINOPOISK_CONNECTION_LIMIT_PER_HOST,
+    KINOPOISK_KEEPALIVE_TIMEOUT,
+    KINOPOISK_CONNECT_TIMEOUT,
+    KINOPOISK_TIMEOUT,
+    KINOPOISK_DEADLINE,
+    KINOPOISK_RETRIES,
+    KINOPOISK_BACKOFF_BASE,
+    KINOPOISK_BACKOFF_MAX,
+    KINOPOISK_BREAKER_THRESHOLD,
+    KINOPOISK_BREAKER_RESET,
+    CACHE_MAX_ENTRIES,
+    CACHE_DEFAULT_TTL,
+    CACHE_SEARCH_TTL,
+    CACHE_STALE_TTL,
+    CACHE_DB_PATH,
+    LOG_SAMPLE_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Общая сессия с пулом keep-alive соединений, создается при первом запросе
+_session: Optional[aiohttp.ClientSession] = None
+
+# Пул ключей API, открывается при первом запросе
+_key_pool: Optional[KeyPool] = None
+
+# Кэш ответов: поиск по названию живет дольше, чем выборки по фильтрам
+response_cache = ResponseCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    default_ttl=CACHE_DEFAULT_TTL,
+    ttls={"/search": CACHE_SEARCH_TTL},
+    db_path=CACHE_DB_PATH or None,
+    stale_ttl=CACHE_STALE_TTL,
+    encode=encode_movie,
+    decode=parse_response,
+)
+
+# Размыкатель: пока API недоступен, запросы отклоняются сразу, а бот отвечает из кэша
+breaker = CircuitBreaker(
+    failure_threshold=KINOPOISK_BREAKER_THRESHOLD,
+    reset_timeout=KINOPOISK_BREAKER_RESET,
+    probe_timeout=KINOPOISK_DEADLINE,
+)
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую сессию для запросов к API, создавая ее при необходимости.
+
+    Сессия должна создаваться внутри работающего цикла событий.
+
+    :return: Сессия aiohttp с пулом соединений.
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=KINOPOISK_CONNECTION_LIMIT,
+            limit_per_host=KINOPOISK_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=KINOPOISK_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=KINOPOISK_TIMEOUT, connect=KINOPOISK_CONNECT_TIMEOUT)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={"accept": "application/json"}
+        )
+    return _session
+
+def get_key_pool() -> KeyPool:
+    """
+    Возвращает пул ключей API, открывая базу счетчиков при первом обращении.
+    """
+    global _key_pool
+    if _key_pool is None:
+        _key_pool = KeyPool(
+            KINOPOISK_API_KEYS,
+            KINOPOISK_KEYS_DB_PATH,
+            daily_limit=KINOPOISK_KEY_DAILY_LIMIT,
+            cooldown=KINOPOISK_KEY_COOLDOWN,
+            invalid_cooldown=KINOPOISK_KEY_INVALID_COOLDOWN,
+            sync_interval=KINOPOISK_KEYS_SYNC_INTERVAL,
+        )
+    return _key_pool
+
+async def close_session() -> None:
+    """
+    Закрывает общую сессию. Вызывается при остановке бота.
+    """
+    global _session, _key_pool
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    if _key_pool is not None:
+        _key_pool.close()
+        _key_pool = None
+
+async def warm_up() -> None:
+    """
+    Прогрев после запуска: ответы из кэша на диске загружаются в память, открываются
+    пул ключей и соединение с API, чтобы первый поиск не ждал TLS-рукопожатия.
+    """
+    # Чтение и разбор ответов с диска идут в рабочем потоке, в память они кладутся в цикле событий
+    response_cache.preload(await asyncio.to_thread(response_cache.read_fresh))
+    get_key_pool()
+    try:
+        # Запрос без ключа не расходует квоту, соединение остается в пуле keep-alive
+        async with get_session().head(KINOPOISK_BASE_URL, timeout=aiohttp.ClientTimeout(total=KINOPOISK_CONNECT_TIMEOUT)):
+            pass
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+
+def _local_catalog() -> Optional[Catalog]:
+    """
+    Возвращает локальный каталог, если он синхронизирован и может отвечать вместо API.
+    """
+    local = get_catalog()
+    return local if local is not None and local.is_ready() else None
+
+async def _request(endpoint: str, params: Dict[str, Any]) -> Dict[str, Union[str, Dict]]:
+    """
+    Возвращает ответ API КиноПоиск из кэша или запрашивает его.
+
+    :param endpoint: Путь относительно KINOPOISK_BASE_URL ('' или '/search').
+    :param params: Параметры запроса.
+    :return: Ответ API или сообщение об ошибке.
+    """
+    return await response_cache.get_or_fetch(endpoint, params, lambda: _fetch(endpoint, params))
+
+async def _fetch(endpoint: str, params: Dict[str, Any]) -> Dict[str, Union[str, Dict]]:
+    """
+    Выполняет GET-запрос к API КиноПоиск через общую сессию.
+
+    Все попытки укладываются в KINOPOISK_DEADLINE. Каждая попытка берет ключ из пула;
+    после 401/403/429 ключ уходит на паузу, и запрос сразу повторяется с другим.
+    Ответы 5xx, таймауты и ошибки соединения повторяются с экспоненциальной паузой;
+    при серии сбоев размыкатель отклоняет запросы сразу, не дожидаясь таймаута.
+
+    :param endpoint: Путь относительно KINOPOISK_BASE_URL ('' или '/search').
+    :param params: Параметры запроса.
+    :return: Ответ API или сообщение об ошибке.
+    """
+    request_url = f"{KINOPOISK_BASE_URL}{endpoint}"
+    label = endpoint or "/movie"
+
+    # Проверка уровня идет первой: при выключенном DEBUG запись ничего не стоит
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SAMPLE_RATE:
+        logger.debug("Запрос к API: %s %s", request_url, params)
+
+    # Эндпоинт /movie возвращает только поля, которые показывает бот
+    query = list(params.items())
+    if not endpoint:
+        query.extend(("selectFields", field) for field in SELECT_FIELDS)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + KINOPOISK_DEADLINE
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            API_REQUESTS.inc(endpoint=label, result="circuit_open")
+            return {"error": "API КиноПоиск временно недоступен"}
+        # Исход пробного запроса должен быть записан на любом пути, иначе размыкатель не замкнется
+        probe = breaker.probing
+        key = get_key_pool().acquire()
+        if key is None:
+            if probe:
+                breaker.release_probe()
+            API_REQUESTS.inc(endpoint=label, result="no_key")
+            logger.warning("Нет ключа API с остатком квоты")
+            return {"error": "Лимит запросов к API исчерпан, попробуйте позже"}
+
+        failure: Optional[str] = None
+        retry_after: Optional[float] = None
+        key_rejected = False
+        timeout = aiohttp.ClientTimeout(
+            total=max(min(KINOPOISK_TIMEOUT, deadline - loop.time()), 0.1),
+            connect=KINOPOISK_CONNECT_TIMEOUT
+        )
+        started = time.perf_counter()
+        try:
+            async with get_session().get(
+                request_url, params=query, headers={"X-API-KEY": key}, timeout=timeout
+            ) as response:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                get_key_pool().report(key, response.status, response.headers, retry_after)
+                if response.status in KEY_REJECT_STATUSES:
+                    # Отказ относится к ключу: следующая попытка пойдет с другим
+                    failure = f"HTTP {response.status}"
+                    key_rejected = True
+                elif response.status in RETRY_STATUSES:
+                    failure = f"HTTP {response.status}"
+                else:
+                    response.raise_for_status()
+                    # Документы сразу разбираются в компактные записи Movie
+                    result = parse_response(await response.json(content_type=None))
+        except aiohttp.ClientResponseError as e:
+            # Остальные ответы 4xx повтор не исправит, но API при этом доступен
+            breaker.record_success()
+            API_REQUESTS.inc(endpoint=label, result="error")
+            logger.warning("Ошибка запроса к API %s: HTTP %s", request_url, e.status)
+            return {"error": "Ошибка запроса к API"}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failure = repr(e)
+        except asyncio.CancelledError:
+            if probe:
+                breaker.release_probe()
+            raise
+        except ValueError:
+            breaker.record_success()
+            API_REQUESTS.inc(endpoint=label, result="bad_json")
+            logger.warning("Ошибка декодирования JSON: %s", request_url)
+            return {"error": "Ошибка декодирования JSON"}
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, endpoint=label)
+
+        if failure is None:
+            breaker.record_success()
+            break
+        if key_rejected:
+            # API отвечает, поэтому отказ ключа не считается сбоем для размыкателя
+            breaker.record_success()
+            delay = 0.0
+        else:
+            breaker.record_failure()
+            delay = retry_after if retry_after is not None else backoff_delay(
+                attempt, KINOPOISK_BACKOFF_BASE, KINOPOISK_BACKOFF_MAX
+            )
+        if attempt >= KINOPOISK_RETRIES or loop.time() + delay >= deadline:
+            API_REQUESTS.inc(endpoint=label, result="error")
+            logger.warning("Ошибка запроса к API %s после %d попыток: %s", request_url, attempt + 1, failure)
+            return {"error": "Ошибка запроса к API"}
+        API_REQUESTS.inc(endpoint=label, result="retry")
+        attempt += 1
+        await asyncio.sleep(delay)
+    API_REQUESTS.inc(endpoint=label, result="ok")
+
+    # Результаты поиска по названию пополняют индекс названий для локального поиска
+    if endpoint == "/search" and isinstance(result, dict):
+        title_index.add_many(result.get("docs") or [])
+    return result
+
+async def fetch_movies(params: Dict[str, Any]) -> Dict[str, Union[str, Dict]]:
+    """
+    Запрашивает страницу эндпоинта /movie в обход кэша (для синхронизации каталога).
+
+    :param params: Параметры запроса.
+    :return: Ответ API или сообщение об ошибке.
+    """
+    return await _fetch("", params)
+
+async def search_movies(
+    title: str = "Spider-Man", page: int = 1, limit: int = 5, source: Optional[str] = None
+) -> Dict[str, Union[str, Dict]]:
     """
     Функция для поиска фильмов по запросу.
 
+    Первая страница берется из индекса названий, только если он заполняет ее целиком;
+    иначе поиск идет в API. Источник возвращается в поле 'source' и передается
+    при запросе следующих страниц, чтобы все страницы выдачи брались из одного места.
+
     :param title: Название фильма (или часть названия). По умолчанию 'Spider-Man'.
     :param page: Номер страницы результатов. По умолчанию 1.
     :param limit: Количество результатов на страницу. По умолчанию 5.
+    :param source: Источник выдачи ('local' или 'api'); None - выбрать по первой странице.
     :return: Результаты поиска или сообщение об ошибке.
     """
+    if source != "api":
+        title_index.load_from_history()
+        matches = title_index.search(title)
+        if source == "local" or len(matches) >= page * limit:
+            # Название найдено среди уже встречавшихся фильмов, запрос к API не нужен
+            return {
+                "docs": [movie for _, movie in matches[(page - 1) * limit:page * limit]],
+                "page": page,
+                "limit": limit,
+                "pages": -(-len(matches) // limit),
+                "source": "local",
+            }
+
     params = {
         "query": title,
         "page": page,
         "limit": limit
     }
-    
-    headers = {
-        "accept": "application/json",
-        "X-API-KEY": KINOPOISK_API_KEY
-    }
-    
-    request_url = f"{KINOPOISK_BASE_URL}/search"
-    
-    print(f"Отправляем запрос: {request_url}?{requests.compat.urlencode(params)}")
-    
-    try:
-        response = requests.get(request_url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса: {e}")
-        return {"error": "Ошибка запроса к API"}
-    except ValueError:
-        print("Ошибка декодирования JSON.")
-        return {"error": "Ошибка декодирования JSON"}
-
-def movie_by_rating(rating_from: float = 7.0, rating_to: float = 10.0, page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
+    result = await _request("/search", params)
+    return {**result, "source": "api"} if "error" not in result else result
+
+async def movie_by_rating(rating_from: float = 7.0, rating_to: float = 10.0, page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
     """
     Функция для поиска фильмов по рейтингу.
 
@@ -47,34 +319,19 @@ def movie_by_rating(rating_from: float = 7.0, rating_to: float = 10.0, page: int
     :param limit: Количество результатов на страницу.
     :return: Результаты поиска или сообщение об ошибке.
     """
+    local = _local_catalog()
+    if local is not None:
+        return local.search(rating=(rating_from, rating_to), page=page, limit=limit)
+
     params = {
         "page": page,
         "limit": limit,
         "rating.imdb": f"{rating_from}-{rating_to}",
         "notNullFields": "name"
     }
-    
-    headers = {
-        "accept": "application/json",
-        "X-API-KEY": KINOPOISK_API_KEY
-    }
-    
-    request_url = KINOPOISK_BASE_URL
-    
-    print(f"Отправляем запрос: {request_url}?{requests.compat.urlencode(params)}")
-    
-    try:
-        response = requests.get(request_url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса: {e}")
-        return {"error": "Ошибка запроса к API"}
-    except ValueError:
-        print("Ошибка декодирования JSON.")
-        return {"error": "Ошибка декодирования JSON"}
-
-def search_low_budget_movies(page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
+    return await _request("", params)
+
+async def search_low_budget_movies(page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
     """
     Функция для поиска фильмов с низким бюджетом (до $10 миллионов).
 
@@ -82,64 +339,39 @@ def search_low_budget_movies(page: int = 1, limit: int = 5) -> Dict[str, Union[s
     :param limit: Количество результатов на страницу.
     :return: Результаты поиска или сообщение об ошибке.
     """
+    local = _local_catalog()
+    if local is not None:
+        return local.search(budget=(0, 10000000), page=page, limit=limit)
+
     params = {
         "budget.value": "0-10000000",
         "page": page,
         "limit": limit,
         "notNullFields": "name"
     }
-    
-    headers = {
-        "accept": "application/json",
-        "X-API-KEY": KINOPOISK_API_KEY
-    }
-    
-    request_url = KINOPOISK_BASE_URL
-    
-    print(f"Отправляем запрос: {request_url}?{requests.compat.urlencode(params)}")
-    
-    try:
-        response = requests.get(request_url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса: {e}")
-        return {"error": "Ошибка запроса к API"}
-    except ValueError:
-        print("Ошибка декодирования JSON.")
-        return {"error": "Ошибка декодирования JSON"}
-
-def search_high_budget_movies(page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
-    
+    return await _request("", params)
+
+async def search_high_budget_movies(page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
+
+    local = _local_catalog()
+    if local is not None:
+        return local.search(budget=(100000000, 100000000000), page=page, limit=limit)
+
     params = {
         "budget.value": "100000000-100000000000",
         "page": page,
         "limit": limit,
         "notNullFields": "name"
     }
-    
-    headers = {
-        "accept": "application/json",
-        "X-API-KEY": KINOPOISK_API_KEY
-    }
-    
-    request_url = KINOPOISK_BASE_URL
-    
-    print(f"Отправляем запрос: {request_url}?{requests.compat.urlencode(params)}")
-    
-    try:
-        response = requests.get(request_url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса: {e}")
-        return {"error": "Ошибка запроса к API"}
-    except ValueError:
-        print("Ошибка декодирования JSON.")
-        return {"error": "Ошибка декодирования JSON"}
-
-def search_movies_by_year(year_start: Optional[int] = None, year_end: Optional[int] = None, page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
-    
+    return await _request("", params)
+
+async def search_movies_by_year(year_start: Optional[int] = None, year_end: Optional[int] = None, page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
+
+    local = _local_catalog()
+    if local is not None:
+        year = (year_start, year_end) if year_start and year_end else None
+        return local.search(year=year, page=page, limit=limit)
+
     year_range = f"{year_start}-{year_end}" if year_start and year_end else ""
     params = {
         "page": page,
@@ -147,75 +379,81 @@ def search_movies_by_year(year_start: Optional[int] = None, year_end: Optional[i
         "year": year_range,
         "notNullFields": "name"
     }
-    
-    headers = {
-        "accept": "application/json",
-        "X-API-KEY": KINOPOISK_API_KEY
-    }
-    
-    request_url = KINOPOISK_BASE_URL
-    
-    print(f"Отправляем запрос: {request_url}?{requests.compat.urlencode(params)}")
-    
-    try:
-        response = requests.get(request_url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса: {e}")
-        return {"error": "Ошибка запроса к API"}
-    except ValueError:
-        print("Ошибка декодирования JSON.")
-        return {"error": "Ошибка декодирования JSON"}
-
-def search_movies_by_genre(genre: str, page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
-    
+    return await _request("", params)
+
+async def search_movies_by_genre(genre: str, page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
+
+    # Нераспознанный жанр API все равно не найдет, запрос не отправляется
+    genre = normalize_genre(genre)
+    if genre is None:
+        return {"docs": [], "page": page, "limit": limit, "pages": 0}
+
+    local = _local_catalog()
+    if local is not None:
+        return local.search(genre=genre, page=page, limit=limit)
+
     params = {
         "genres.name": genre,
         "page": page,
         "limit": limit,
         "notNullFields": "name"
     }
-    
-    headers = {
-        "accept": "application/json",
-        "X-API-KEY": KINOPOISK_API_KEY
+    return await _request("", params)
+
+async def search_new_movies_by_genre(genre: str, year: int, page: int = 1, limit: int = 5) -> Dict[str, Union[str, Dict]]:
+    """
+    Фильмы жанра, вышедшие в указанном году, с самым высоким рейтингом - для подборки новинок.
+
+    :param genre: Жанр (пункт меню, форма слова или название в API).
+    :param year: Год выпуска.
+    :param page: Номер страницы результатов.
+    :param limit: Количество результатов на страницу.
+    :return: Результаты поиска или сообщение об ошибке.
+    """
+    genre = normalize_genre(genre)
+    if genre is None:
+        return {"docs": [], "page": page, "limit": limit, "pages": 0}
+
+    local = _local_catalog()
+    if local is not None:
+        return local.search(genre=genre, year=(year, year), page=page, limit=limit)
+
+    params = {
+        "genres.name": genre,
+        "year": year,
+        "sortField": "rating.imdb",
+        "sortType": -1,
+        "page": page,
+        "limit": limit,
+        "notNullFields": "name"
     }
-    
-    request_url = KINOPOISK_BASE_URL
-    
-    print(f"Отправляем запрос: {request_url}?{requests.compat.urlencode(params)}")
-    
+    return await _request("", params)
+
+async def _main() -> None:
+    # Примеры вызова функций
     try:
-        response = requests.get(request_url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Ошибка запроса: {e}")
-        return {"error": "Ошибка запроса к API"}
-    except ValueError:
-        print("Ошибка декодирования JSON.")
-        return {"error": "Ошибка декодирования JSON"}
+        result_search = await search_movies()
+        print(result_search)
+
+        result_rating = await movie_by_rating(rating_from=8.0, rating_to=9.5)
+        # print(result_rating)
+
+        result_low_budget = await search_low_budget_movies()
+        # print(result_low_budget)
+
+        result_high_budget = await search_high_budget_movies()
+        # print(result_high_budget)
+
+        result_year = await search_movies_by_year(year_start=2012, year_end=2012)
+        # print(result_year)
+
+        genres = ["Комедия", "Ужасы", "Фантастика"]
+        for genre in genres:
+            result_genre = await search_movies_by_genre(genre=genre)
+            print(f"Результаты для жанра '{genre}':")
+        #     print(result_genre)
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
-    # Примеры вызова функций
-    result_search = search_movies()
-    print(result_search)
-    
-    result_rating = movie_by_rating(rating_from=8.0, rating_to=9.5)
-    # print(result_rating)
-    
-    result_low_budget = search_low_budget_movies()
-    # print(result_low_budget)
-    
-    result_high_budget = search_high_budget_movies()
-    # print(result_high_budget)
-    
-    result_year = search_movies_by_year(year_start=2012, year_end=2012)
-    # print(result_year)
-    
-    genres = ["Комедия", "Ужасы", "Фантастика"]
-    for genre in genres:
-        result_genre = search_movies_by_genre(genre=genre)
-        print(f"Результаты для жанра '{genre}':")
-    #     print(result_genre)
+    asyncio.run(_main())
@@ -0,0 +1,261 @@
+"""
+Метрики бота в текстовом формате Prometheus.
+
+    METRICS_PORT=9100 python bot.py
+    curl http://127.0.0.1:9100/metrics
+"""
+import bisect
+import contextlib
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+Collector = Callable[[], Dict[str, float]]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Монотонно растущий счетчик с метками.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+
+        key = tuple(str(labels[name]) for name in self.label_names)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами и метками. Наблюдение стоит
+    один бинарный поиск и несколько сложений.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счетчики корзин (последняя - +Inf), сумма
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+
+        key = tuple(str(labels[name]) for name in self.label_names)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Измеряет время выполнения блока. Работает и как декоратор функции.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total[0]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик процесса. Кроме счетчиков и гистограмм принимает сборщики:
+    функции, которые при каждом запросе /metrics возвращают текущие значения
+    (например, stats() кэшей и очередей).
+    """
+
+    def __init__(self) -> None:
+        self._metrics: List[Any] = []
+        self._collectors: List[Tuple[str, str, Collector]] = []
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, documentation: str, collect: Collector) -> None:
+        """
+        Публикует значения словаря collect() как метрики {prefix}_{ключ}.
+        """
+        self._collectors.append((prefix, documentation, collect))
+
+    def render(self) -> str:
+
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, documentation, collect in self._collectors:
+            for key, value in collect().items():
+                name = f"{prefix}_{key}"
+                lines.extend((f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_seconds", "Время обработки обновления обработчиком", ["handler"]
+)
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ["handler"]
+)
+API_LATENCY = registry.histogram(
+    "kinopoisk_request_seconds", "Время запроса к API КиноПоиск", ["endpoint"]
+)
+API_REQUESTS = registry.counter(
+    "kinopoisk_requests_total", "Запросы к API КиноПоиск по результату", ["endpoint", "result"]
+)
+HISTORY_LATENCY = registry.histogram(
+    "history_operation_seconds",
+    "Время операций с историей запросов",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+TELEGRAM_LATENCY = registry.histogram(
+    "telegram_request_seconds", "Время запроса к Bot API", ["method"]
+)
+TELEGRAM_ERRORS = registry.counter(
+    "telegram_request_errors_total", "Запросы к Bot API, завершившиеся ошибкой", ["method"]
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Измеряет время работы обработчиков сообщений и нажатий кнопок.
+    Регистрируется как внутренний middleware, когда обработчик уже выбран.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Any],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Измеряет время запросов к Bot API. Регистрируется после RateLimitMiddleware,
+    чтобы ожидание в очереди отправки не попадало в измерение.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            TELEGRAM_ERRORS.inc(method=name)
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - started, method=name)
+
+
+async def handle_metrics(_: "web.Request") -> "web.Response":
+
+    from aiohttp import web
+
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> Optional["web.AppRunner"]:
+    """
+    Запускает HTTP-сервер с маршрутом /metrics.
+
+    :param port: Порт; 0 - метрики не публикуются.
+    :return: Запущенный сервер или None.
+    """
+    if not port:
+        return None
+    # Серверная часть aiohttp загружается, только если метрики публикуются
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,142 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# Поля документа фильма, которые запрашиваются у API (параметр selectFields)
+SELECT_FIELDS: Tuple[str, ...] = (
+    "id", "name", "alternativeName", "description", "rating", "year",
+    "genres", "ageRating", "poster", "budget",
+)
+
+
+class Movie:
+    """
+    Компактная запись фильма: только поля, которые показывает бот, плюс бюджет
+    для локального каталога. Вместо вложенных словарей ответа API хранит плоские
+    значения в __slots__, что заметно уменьшает размер записи в кэшах.
+    """
+
+    __slots__ = (
+        "id", "name", "alternative_name", "description", "rating",
+        "year", "genres", "age_rating", "poster", "budget",
+    )
+
+    def __init__(
+        self,
+        id: Optional[int] = None,
+        name: Optional[str] = None,
+        alternative_name: Optional[str] = None,
+        description: Optional[str] = None,
+        rating: Optional[float] = None,
+        year: Optional[int] = None,
+        genres: Tuple[str, ...] = (),
+        age_rating: Optional[int] = None,
+        poster: Optional[str] = None,
+        budget: Optional[float] = None,
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.alternative_name = alternative_name
+        self.description = description
+        self.rating = rating
+        self.year = year
+        self.genres = genres
+        self.age_rating = age_rating
+        self.poster = poster
+        self.budget = budget
+
+    def __repr__(self) -> str:
+        return f"Movie(id={self.id!r}, name={self.name!r}, year={self.year!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Movie):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "Movie":
+        """
+        Разбирает документ фильма в формате API КиноПоиск.
+        """
+        return cls(
+            id=doc.get("id"),
+            name=doc.get("name"),
+            alternative_name=doc.get("alternativeName"),
+            description=doc.get("description"),
+            rating=(doc.get("rating") or {}).get("imdb"),
+            year=doc.get("year"),
+            genres=tuple(genre["name"] for genre in doc.get("genres") or [] if genre.get("name")),
+            age_rating=doc.get("ageRating"),
+            poster=(doc.get("poster") or {}).get("url"),
+            budget=(doc.get("budget") or {}).get("value"),
+        )
+
+    def to_doc(self) -> Dict[str, Any]:
+        """
+        Документ в формате API с теми же полями: для кэша на диске и локального каталога.
+        """
+        return {
+            "id": self.id,
+            "name": self.name,
+            "alternativeName": self.alternative_name,
+            "description": self.description,
+            "rating": {"imdb": self.rating},
+            "year": self.year,
+            "genres": [{"name": genre} for genre in self.genres],
+            "ageRating": self.age_rating,
+            "poster": {"url": self.poster},
+            "budget": {"value": self.budget},
+        }
+
+    @classmethod
+    def from_history_entry(cls, entry: Dict[str, Any]) -> "Movie":
+        """
+        Восстанавливает фильм из записи истории.
+        """
+        return cls(
+            id=entry.get("id"),
+            name=entry.get("title"),
+            description=entry.get("description"),
+            rating=entry.get("rating"),
+            year=entry.get("year"),
+            genres=tuple(name.strip() for name in (entry.get("genre") or "").split(",") if name.strip()),
+            age_rating=entry.get("age_rating"),
+            poster=entry.get("poster"),
+        )
+
+    def to_history_entry(self, date: str) -> Dict[str, Any]:
+        """
+        Запись истории о показе фильма.
+
+        :param date: Дата показа в формате ДД-ММ-ГГГГ ЧЧ:ММ:СС.
+        """
+        return {
+            "id": self.id,
+            "date": date,
+            "title": self.name,
+            "description": self.description,
+            "rating": self.rating,
+            "year": self.year,
+            "genre": ", ".join(self.genres),
+            "age_rating": self.age_rating,
+            "poster": self.poster,
+            "watched": False,
+        }
+
+
+def parse_response(response: Any) -> Any:
+    """
+    Заменяет документы фильмов в ответе API записями Movie. Ответы без docs
+    (ошибки) возвращаются без изменений.
+    """
+    if isinstance(response, dict) and isinstance(response.get("docs"), list):
+        docs: List[Any] = response["docs"]
+        response["docs"] = [doc if isinstance(doc, Movie) else Movie.from_doc(doc) for doc in docs]
+    return response
+
+
+def encode_movie(value: Any) -> Dict[str, Any]:
+    """
+    Обработчик default для json.dumps: сериализует записи Movie.
+    """
+    if isinstance(value, Movie):
+        return value.to_doc()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
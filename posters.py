@@ -0,0 +1,125 @@
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from cache import ResponseCache
+from config import (
+    POSTER_CHECK_CONCURRENCY,
+    POSTER_CHECK_TIMEOUT,
+    POSTER_CACHE_MAX_ENTRIES,
+    POSTER_CACHE_TTL,
+    POSTER_RETRY_TTL,
+    CACHE_DB_PATH,
+)
+
+# Общая сессия для проверки постеров и ограничение числа одновременных проверок
+_session: Optional[aiohttp.ClientSession] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+# Результаты проверки постеров и file_id загруженных в Telegram фото по id фильма
+poster_cache = ResponseCache(
+    max_entries=POSTER_CACHE_MAX_ENTRIES,
+    default_ttl=POSTER_CACHE_TTL,
+    db_path=CACHE_DB_PATH or None,
+    table="poster_cache",
+)
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Возвращает общую сессию для запросов к серверу постеров.
+    """
+    global _session, _semaphore
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=POSTER_CHECK_CONCURRENCY),
+            timeout=aiohttp.ClientTimeout(total=POSTER_CHECK_TIMEOUT)
+        )
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(POSTER_CHECK_CONCURRENCY)
+    return _session
+
+async def warm_up() -> None:
+    """
+    Прогрев после запуска: результаты проверок постеров загружаются с диска в память.
+    """
+    poster_cache.preload(await asyncio.to_thread(poster_cache.read_fresh))
+    get_session()
+
+async def close_session() -> None:
+
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def check_poster(url: Optional[str]) -> Optional[bool]:
+    """
+    Проверяет HEAD-запросом, что по ссылке доступно изображение.
+
+    :param url: Ссылка на постер.
+    :return: True, если сервер вернул 200 и Content-Type изображения; False, если ответ
+             окончательный (4xx или не изображение); None при таймауте, ошибке соединения или 5xx.
+    """
+    if not url:
+        return False
+    session = get_session()
+    async with _semaphore:
+        try:
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status >= 500 or response.status == 429:
+                    return None
+                return response.status == 200 and 'image' in response.headers.get('Content-Type', '')
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+def _cache_key(movie_id: Optional[int]) -> str:
+
+    return f"poster:{movie_id}"
+
+async def resolve_poster(movie_id: Optional[int], url: Optional[str]) -> Optional[str]:
+    """
+    Возвращает, что передать в Telegram для постера фильма: сохраненный file_id,
+    проверенную ссылку или None, если постер недоступен. HEAD-запрос выполняется
+    только при отсутствии актуальной записи в кэше. Сбой проверки запоминается
+    на POSTER_RETRY_TTL, окончательный ответ - на POSTER_CACHE_TTL.
+
+    :param movie_id: Id фильма на КиноПоиске.
+    :param url: Ссылка на постер.
+    :return: file_id, ссылка или None.
+    """
+    if not url:
+        return None
+    key = _cache_key(movie_id)
+    # Запись для другой ссылки устарела: постер фильма сменился
+    entry = poster_cache.lookup(key, lambda cached: cached.get("url") == url) if movie_id is not None else None
+    if entry is None:
+        valid = await check_poster(url)
+        entry = {"url": url, "valid": bool(valid), "file_id": None}
+        if movie_id is not None:
+            poster_cache.set(key, entry, poster_cache.default_ttl if valid is not None else POSTER_RETRY_TTL)
+    if not entry["valid"]:
+        return None
+    return entry["file_id"] or url
+
+async def resolve_posters(movies: Sequence[Tuple[Optional[int], Optional[str]]]) -> List[Optional[str]]:
+    """
+    Параллельно разрешает постеры целой страницы результатов.
+
+    :param movies: Пары (id фильма, ссылка на постер).
+    :return: Результаты resolve_poster в том же порядке.
+    """
+    return list(await asyncio.gather(*(resolve_poster(movie_id, url) for movie_id, url in movies)))
+
+def remember_file_id(movie_id: Optional[int], url: str, file_id: str) -> None:
+    """
+    Сохраняет file_id фото после первой успешной отправки, чтобы следующие
+    отправки не заставляли Telegram заново скачивать изображение.
+    """
+    if movie_id is None:
+        return
+    poster_cache.set(
+        _cache_key(movie_id),
+        {"url": url, "valid": True, "file_id": file_id},
+        poster_cache.default_ttl
+    )
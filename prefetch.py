@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from send_queue import TokenBucket
+
+
+class Prefetcher:
+    """
+    Загружает в фоне следующую страницу последнего запроса пользователя, чтобы
+    кнопка "Обновить" отвечала сразу. Для каждого чата хранится одна страница
+    с коротким сроком жизни; число фоновых запросов ограничено общим бюджетом.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 120.0,
+        max_users: int = 10000,
+        budget_per_minute: float = 30.0,
+        max_concurrent: int = 5,
+    ) -> None:
+        """
+        :param ttl: Время жизни загруженной страницы, в секундах.
+        :param max_users: Максимальное количество чатов в буфере.
+        :param budget_per_minute: Максимум фоновых запросов к API в минуту.
+        :param max_concurrent: Максимум одновременных фоновых запросов.
+        """
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_concurrent = max_concurrent
+        self._budget = TokenBucket(budget_per_minute / 60, budget_per_minute)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._buffer: "OrderedDict[int, Tuple[str, float, asyncio.Task[Dict[str, Any]]]]" = OrderedDict()
+
+        self.scheduled = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(name: str, kwargs: Dict[str, Any]) -> str:
+
+        return json.dumps({"name": name, "kwargs": kwargs}, sort_keys=True, ensure_ascii=False)
+
+    def schedule(self, chat_id: int, name: str, kwargs: Dict[str, Any], fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> bool:
+        """
+        Запускает фоновую загрузку страницы для чата, если позволяет бюджет.
+
+        :param chat_id: Чат пользователя.
+        :param name: Имя функции поиска.
+        :param kwargs: Параметры запроса страницы.
+        :param fetch: Корутина, выполняющая запрос.
+        :return: True, если загрузка запущена.
+        """
+        now = time.monotonic()
+        if self._budget.wait_time(now) > 0:
+            self.skipped += 1
+            return False
+        self._budget.consume(1, now)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def limited() -> Dict[str, Any]:
+            async with self._semaphore:
+                return await fetch()
+
+        self._drop(chat_id)
+        self._buffer[chat_id] = (self._key(name, kwargs), now + self.ttl, asyncio.create_task(limited()))
+        while len(self._buffer) > self.max_users:
+            self._drop(next(iter(self._buffer)))
+        self.scheduled += 1
+        return True
+
+    async def take(self, chat_id: int, name: str, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает загруженную заранее страницу, если она есть для этого запроса
+        и еще не устарела. Если загрузка не завершена, дожидается ее.
+
+        :return: Ответ API или None.
+        """
+        entry = self._buffer.pop(chat_id, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        key, expires_at, task = entry
+        if key != self._key(name, kwargs) or expires_at <= time.monotonic():
+            task.cancel()
+            self.misses += 1
+            return None
+        try:
+            result = await task
+        except Exception:
+            result = None
+        if not result or 'error' in result:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Метрики предзагрузки: запущенные и пропущенные загрузки, попадания и промахи.
+        """
+        return {
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "hits": self.hits,
+            "misses": self.misses,
+            "buffered": len(self._buffer),
+        }
+
+    def _drop(self, chat_id: int) -> None:
+
+        entry = self._buffer.pop(chat_id, None)
+        if entry is not None:
+            entry[2].cancel()
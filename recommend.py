@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from catalog import Catalog, get_catalog
+from config import (
+    RECOMMEND_HISTORY_POOL,
+    RECOMMEND_INDEX_TTL,
+    RECOMMEND_MAX_USERS,
+    RECOMMEND_RESULTS,
+)
+from history_manager import HistoryEntry, get_seen_movies, get_watched_movies
+from movies import Movie
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from similarity import FeatureIndex
+
+
+class _Profile:
+    """
+    Просмотренные фильмы пользователя, сумма их векторов и готовый список рекомендаций.
+    """
+
+    __slots__ = ("vectors", "total", "ranking")
+
+    def __init__(self, vectors: Dict[int, "np.ndarray"], total: "np.ndarray") -> None:
+        self.vectors = vectors
+        self.total = total
+        self.ranking: Optional[List[int]] = None
+
+
+class Recommender:
+    """
+    Рекомендации по просмотренным фильмам на локальных данных: кандидаты берутся
+    из каталога, а без него - из фильмов, которые бот уже показывал. Профили
+    и списки рекомендаций хранятся для max_users пользователей; отметка
+    просмотра меняет профиль на вектор одного фильма, и список пересчитывается
+    при следующем запросе.
+    """
+
+    def __init__(
+        self,
+        max_users: int = 10000,
+        results: int = 50,
+        index_ttl: float = 3600.0,
+        history_pool: int = 5000,
+    ) -> None:
+        """
+        :param max_users: Количество пользователей, для которых хранятся профили.
+        :param results: Длина списка рекомендаций пользователя.
+        :param index_ttl: Через сколько секунд матрица признаков строится заново.
+        :param history_pool: Количество кандидатов из истории, если каталога нет.
+        """
+        self.max_users = max_users
+        self.results = results
+        self.index_ttl = index_ttl
+        self.history_pool = history_pool
+        self._index: Optional["FeatureIndex"] = None
+        self._index_key: Optional[Tuple[int, int, int]] = None
+        self._profiles: "OrderedDict[int, _Profile]" = OrderedDict()
+        self._refresh_task: Optional["asyncio.Task[None]"] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def _catalog_key(self) -> Optional[Tuple[int, int, int]]:
+
+        catalog = get_catalog()
+        return (id(catalog), catalog.revision, len(catalog)) if catalog is not None and len(catalog) else None
+
+    def _build_index(self, catalog: Optional[Catalog], movies: List[Movie]) -> "FeatureIndex":
+        """
+        Строит матрицу признаков по каталогу или по фильмам из истории; выполняется в отдельном потоке.
+        """
+        # NumPy нужен только рекомендациям и не замедляет запуск бота
+        from similarity import FeatureIndex
+
+        if catalog is not None:
+            return FeatureIndex(catalog.features())
+        return FeatureIndex(
+            [(movie.id, movie.year, movie.rating, movie.genres) for movie in movies],
+            movies={movie.id: movie for movie in movies},
+        )
+
+    async def _refresh(self, key: Optional[Tuple[int, int, int]]) -> None:
+
+        try:
+            catalog = get_catalog() if key is not None else None
+            movies: List[Movie] = []
+            if catalog is None:
+                # История читается в цикле событий: ее соединение и очередь записи общие с ботом
+                movies = [Movie.from_history_entry(entry) for entry in get_seen_movies(self.history_pool)]
+            index = await asyncio.to_thread(self._build_index, catalog, movies)
+        except Exception:
+            if self._index is None:
+                raise
+            logger.exception("Не удалось перестроить матрицу рекомендаций")
+            return
+        finally:
+            self._refresh_task = None
+        # Матрица и профили заменяются вместе: векторы в профилях построены по старым шкалам
+        self._index = index
+        self._index_key = key
+        self._profiles.clear()
+        self.rebuilds += 1
+
+    async def _current_index(self) -> "FeatureIndex":
+        """
+        Матрица признаков; строится заново, если каталог изменился или истек index_ttl.
+        Новая матрица строится в отдельном потоке, а до ее готовности используется прежняя.
+        """
+        key = self._catalog_key()
+        index = self._index
+        if index is not None and self._index_key == key and time.monotonic() - index.built_at < self.index_ttl:
+            return index
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh(key))
+        if index is None:
+            # shield: отмена запроса пользователя не должна отменять общее построение
+            await asyncio.shield(self._refresh_task)
+        return self._index
+
+    def _entry_vector(self, index: "FeatureIndex", entry: HistoryEntry) -> "np.ndarray":
+
+        movie = Movie.from_history_entry(entry)
+        return index.vector(movie.id, movie.year, movie.rating, movie.genres)
+
+    def _profile(self, index: "FeatureIndex", user_id: int) -> _Profile:
+
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            watched = get_watched_movies(user_id)
+            vectors = {int(entry["id"]): self._entry_vector(index, entry) for entry in watched}
+            profile = _Profile(vectors, index.total(vectors.values()))
+            if not profile.vectors:
+                # Пустой профиль не запоминается: отметка могла прийти в другой процесс бота
+                return profile
+            self._profiles[user_id] = profile
+            while len(self._profiles) > self.max_users:
+                self._profiles.popitem(last=False)
+        self._profiles.move_to_end(user_id)
+        return profile
+
+    async def ranking(self, user_id: int) -> Optional[List[int]]:
+        """
+        Id рекомендованных пользователю фильмов по убыванию сходства.
+
+        :return: Список id или None, если пользователь еще не отметил просмотренных фильмов.
+        """
+        index = await self._current_index()
+        profile = self._profile(index, user_id)
+        if not profile.vectors:
+            return None
+        if profile.ranking is None:
+            self.misses += 1
+            profile.ranking = index.rank(profile.total, set(profile.vectors), self.results)
+        else:
+            self.hits += 1
+        return profile.ranking
+
+    async def prepare(self) -> None:
+        """
+        Прогрев: матрица признаков строится в отдельном потоке до первого запроса.
+        """
+        await self._current_index()
+
+    def movies(self, ids: List[int]) -> List[Movie]:
+        """
+        Записи фильмов по id из каталога или из истории, в том же порядке.
+        """
+        index = self._index
+        if index is not None and index.movies is not None:
+            return [index.movies[movie_id] for movie_id in ids if movie_id in index.movies]
+        catalog = get_catalog()
+        return catalog.get_many(ids) if catalog is not None else []
+
+    def on_watch_changed(self, user_id: int, movie_id: int, watched: bool) -> None:
+        """
+        Учитывает отметку просмотра: вектор фильма добавляется в профиль или вычитается
+        из него, а список рекомендаций пересчитывается при следующем запросе.
+        Если фильма нет среди кандидатов, профиль строится заново из истории.
+        """
+        profile = self._profiles.get(user_id)
+        if profile is None or self._index is None:
+            return
+        movie_id = int(movie_id)
+        if watched and movie_id not in profile.vectors:
+            position = self._index.positions.get(movie_id)
+            if position is None:
+                del self._profiles[user_id]
+                return
+            vector = self._index.matrix[position]
+            profile.vectors[movie_id] = vector
+            profile.total = profile.total + vector
+        elif not watched and movie_id in profile.vectors:
+            profile.total = profile.total - profile.vectors.pop(movie_id)
+        else:
+            return
+        profile.ranking = None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Метрики рекомендаций: размер матрицы, профили в памяти, попадания в готовые списки и перестроения.
+        """
+        return {
+            "movies": len(self._index) if self._index is not None else 0,
+            "users": len(self._profiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+        }
+
+
+recommender = Recommender(
+    max_users=RECOMMEND_MAX_USERS,
+    results=RECOMMEND_RESULTS,
+    index_ttl=RECOMMEND_INDEX_TTL,
+    history_pool=RECOMMEND_HISTORY_POOL,
+)
+
+
+async def recommend_movies(user_id: int, limit: int = 5, page: int = 1) -> Dict[str, Any]:
+    """
+    Страница рекомендаций в формате ответа API, чтобы бот показывал ее как результаты поиска.
+
+    :param user_id: Идентификатор чата.
+    :param limit: Количество фильмов на странице.
+    :param page: Номер страницы.
+    """
+    ranking = await recommender.ranking(user_id)
+    if ranking is None:
+        return {"error": "Отметьте просмотренные фильмы в истории запросов, чтобы получить рекомендации."}
+    if not ranking:
+        return {"error": "Пока не из чего выбрать рекомендации. Попробуйте позже."}
+    pages = (len(ranking) + limit - 1) // limit
+    return {
+        "docs": recommender.movies(ranking[(page - 1) * limit:page * limit]),
+        "page": page,
+        "limit": limit,
+        "pages": pages,
+    }
@@ -0,0 +1,174 @@
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardMarkup
+
+from config import RENDER_CACHE_MAX_ENTRIES
+from genres import GENRES
+from movies import Movie
+
+CAPTION_LIMIT = 1024  # Максимальная длина подписи к фото в Telegram
+MESSAGE_LIMIT = 4096  # Максимальная длина текстового сообщения в Telegram
+# Место под заголовок и статус записи истории, остальное отводится карточке фильма
+HISTORY_CARD_LIMIT = MESSAGE_LIMIT - 256
+
+# Символы разметки Markdown (parse_mode='Markdown'), которые нужно экранировать в тексте
+_MARKDOWN_SPECIAL = re.compile(r"([_*`\[])")
+
+
+def escape_markdown(text: Any) -> str:
+    """
+    Экранирует символы разметки, чтобы названия и описания не ломали сообщение.
+    """
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", str(text))
+
+
+def _build_card(movie: Movie, max_length: Optional[int]) -> str:
+
+    description = escape_markdown(movie.description or 'Нет описания')
+    card_template = (
+        f"*Название:* {escape_markdown(movie.name)}\n"
+        "*Описание:* {description}\n"
+        f"*Рейтинг IMDb:* {movie.rating if movie.rating is not None else 'Нет рейтинга'}\n"
+        f"*Год:* {movie.year if movie.year is not None else 'Неизвестно'}\n"
+        f"*Жанр:* {escape_markdown(', '.join(movie.genres))}\n"
+        f"*Возрастной рейтинг:* {movie.age_rating if movie.age_rating is not None else 'N/A'}\n"
+    )
+    if max_length is not None:
+        room = max_length - len(card_template) + len("{description}")
+        if len(description) > room:
+            # Обрезанное экранирование в конце строки сломало бы разметку
+            description = description[:max(room - 1, 0)].rstrip().rstrip("\\") + "…"
+    return card_template.replace("{description}", description)
+
+
+class CardCache:
+    """
+    Готовые карточки фильмов по id и ограничению длины. Версия - хэш отображаемых
+    полей: если данные фильма изменились, карточка строится заново.
+    """
+
+    def __init__(self, max_entries: int = 5000) -> None:
+        self.max_entries = max_entries
+        self._cards: "OrderedDict[Tuple[int, Optional[int]], Tuple[int, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def version(movie: Movie) -> int:
+
+        return hash((movie.name, movie.description, movie.rating, movie.year, movie.genres, movie.age_rating))
+
+    def render(self, movie: Movie, max_length: Optional[int] = None) -> str:
+        """
+        Возвращает Markdown-карточку фильма, строя ее только при первом обращении.
+        """
+        if movie.id is None:
+            return _build_card(movie, max_length)
+        key = (movie.id, max_length)
+        version = self.version(movie)
+        cached = self._cards.get(key)
+        if cached is not None and cached[0] == version:
+            self._cards.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        card = _build_card(movie, max_length)
+        self._cards[key] = (version, card)
+        self._cards.move_to_end(key)
+        while len(self._cards) > self.max_entries:
+            self._cards.popitem(last=False)
+        return card
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Метрики кэша карточек: попадания, промахи и число карточек.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cards)}
+
+
+card_cache = CardCache(max_entries=RENDER_CACHE_MAX_ENTRIES)
+
+
+def format_movie_card(movie: Movie, max_length: Optional[int] = None) -> str:
+    """
+    Формирует Markdown-карточку фильма с экранированными значениями.
+
+    Args:
+        movie (Movie): Фильм из ответа API или истории.
+        max_length (Optional[int]): Ограничение длины карточки; при превышении сокращается описание.
+    """
+    return card_cache.render(movie, max_length)
+
+
+def format_history_entry(entry: Dict[str, Any], position: int, total: int) -> str:
+    """
+    Формирует Markdown-карточку записи истории для постраничного просмотра.
+
+    Args:
+        entry (Dict[str, Any]): Запись истории.
+        position (int): Номер записи за день, начиная с нуля.
+        total (int): Количество записей за день.
+    """
+    header = f"*Запись {position + 1} из {total}*\n*Дата поиска:* {escape_markdown(entry['date'])}\n"
+    footer = f"*Статус:* {'Просмотрен' if entry.get('watched', False) else 'Не просмотрен'}\n"
+    return header + format_movie_card(Movie.from_history_entry(entry), HISTORY_CARD_LIMIT) + footer
+
+
+@lru_cache(maxsize=1)
+def get_main_menu() -> InlineKeyboardMarkup:
+
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Найти фильм по названию", callback_data="movie_search")
+    builder.button(text="Найти фильм по рейтингу", callback_data="movie_by_rating")
+    builder.button(text="Найти фильмы с низким бюджетом", callback_data="low_budget_movie")
+    builder.button(text="Найти фильмы с высоким бюджетом", callback_data="high_budget_movie")
+    builder.button(text="Найти фильм по году выпуска", callback_data="movie_by_year")
+    builder.button(text="Найти фильм по жанру", callback_data="movie_by_genre")
+    builder.button(text="История запросов", callback_data="history")
+    builder.button(text="Рекомендации", callback_data="recommend")
+    builder.button(text="Обновить", callback_data="refresh")
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=1)
+def get_genre_menu() -> InlineKeyboardMarkup:
+
+    builder = InlineKeyboardBuilder()
+    for label, genre in GENRES:
+        builder.button(text=label, callback_data=f"genre:{genre}")
+    builder.adjust(3)
+    return builder.as_markup()
+
+
+@lru_cache(maxsize=4096)
+def get_history_buttons(
+    date_str: str, offset: int, total: int, has_poster: bool, has_id: bool = True
+) -> InlineKeyboardMarkup:
+    """
+    Клавиатура записи истории: статус просмотра (если у фильма есть id), постер по запросу и навигация.
+    Дата и номер записи передаются в callback_data, поэтому страница не хранит состояние.
+    """
+    builder = InlineKeyboardBuilder()
+    sizes = []
+    if has_id:
+        builder.button(text="Просмотрен", callback_data=f"hist_mark:1:{date_str}:{offset}")
+        builder.button(text="Не просмотрен", callback_data=f"hist_mark:0:{date_str}:{offset}")
+        sizes.append(2)
+    if has_poster:
+        builder.button(text="Постер", callback_data=f"hist_poster:{date_str}:{offset}")
+        sizes.append(1)
+    navigation = 0
+    if offset > 0:
+        builder.button(text="◀", callback_data=f"hist:{date_str}:{offset - 1}")
+        navigation += 1
+    if offset < total - 1:
+        builder.button(text="▶", callback_data=f"hist:{date_str}:{offset + 1}")
+        navigation += 1
+    if navigation:
+        sizes.append(navigation)
+    builder.adjust(*sizes)
+    return builder.as_markup()
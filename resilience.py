@@ -0,0 +1,120 @@
+import random
+import time
+from typing import Dict, Optional
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Пауза перед повтором: экспоненциальный рост с полным случайным разбросом,
+    чтобы повторы множества запросов не приходили в API одновременно.
+
+    :param attempt: Номер повтора, начиная с нуля.
+    :param base: Пауза перед первым повтором, в секундах.
+    :param cap: Максимальная пауза, в секундах.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Значение заголовка Retry-After в секундах или None, если оно не задано числом.
+    """
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """
+    Размыкатель: после failure_threshold сбоев подряд запросы отклоняются сразу
+    в течение reset_timeout секунд. Затем пропускается один пробный запрос:
+    при успехе размыкатель замыкается, при сбое снова размыкается. Если исход
+    пробного запроса не пришел за probe_timeout секунд, пропускается следующий.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, probe_timeout: float = 30.0) -> None:
+        """
+        :param failure_threshold: Количество сбоев подряд до размыкания.
+        :param reset_timeout: Время до пробного запроса, в секундах.
+        :param probe_timeout: Сколько секунд ждать исхода пробного запроса.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """
+        Можно ли выполнить запрос сейчас. В полуоткрытом состоянии пропускает
+        только один пробный запрос.
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            now = time.monotonic()
+            if self._probe_in_flight and now - self._probe_started < self.probe_timeout:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+            self._probe_started = now
+        return True
+
+    @property
+    def probing(self) -> bool:
+        """
+        Пропущен ли пробный запрос, исход которого еще не записан.
+        """
+        return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def release_probe(self) -> None:
+        """
+        Отменяет пробный запрос, который не дошел до API (нет ключа или запрос
+        отменен): следующий вызов allow() пропустит новый пробный запрос.
+        """
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Метрики размыкателя: открыт ли он сейчас, сколько раз размыкался и сколько запросов отклонил.
+        """
+        return {
+            "open": int(self.state == self.OPEN),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
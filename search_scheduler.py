@@ -0,0 +1,84 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Set, Tuple
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class SearchScheduler:
+    """
+    Планировщик поисковых запросов пользователей.
+
+    Одновременно выполняется не больше max_concurrent поисков на всего бота и не больше
+    одного на чат. Пока поиск чата ждет очереди, новый запрос того же чата заменяет его.
+    Чаты получают свободные слоты по очереди (round-robin), поэтому активный пользователь
+    не может занять все слоты.
+    """
+
+    def __init__(self, max_concurrent: int = 10) -> None:
+        self.max_concurrent = max_concurrent
+        self._running: Set[Hashable] = set()
+        self._pending: Dict[Hashable, Tuple[Job, "asyncio.Future[bool]"]] = {}
+        self._ready: Deque[Hashable] = deque()
+
+        self.started = 0
+        self.superseded = 0
+
+    async def run(self, chat_id: Hashable, job: Job) -> bool:
+        """
+        Ставит поиск чата в очередь и ждет его завершения.
+
+        :param chat_id: Чат пользователя.
+        :param job: Корутина поиска и отправки результатов.
+        :return: True, если поиск выполнен; False, если его заменил более новый запрос.
+        """
+        future: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+        stale = self._pending.get(chat_id)
+        if stale is not None:
+            self.superseded += 1
+            if not stale[1].done():
+                stale[1].set_result(False)
+        elif chat_id not in self._running:
+            self._ready.append(chat_id)
+        self._pending[chat_id] = (job, future)
+        self._dispatch()
+        return await future
+
+    def _dispatch(self) -> None:
+
+        while self._ready and len(self._running) < self.max_concurrent:
+            chat_id = self._ready.popleft()
+            job, future = self._pending.pop(chat_id)
+            if future.done():
+                # Ожидавший обработчик отменен
+                continue
+            self._running.add(chat_id)
+            self.started += 1
+            asyncio.create_task(self._execute(chat_id, job, future))
+
+    async def _execute(self, chat_id: Hashable, job: Job, future: "asyncio.Future[bool]") -> None:
+
+        try:
+            await job()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(True)
+        finally:
+            self._running.discard(chat_id)
+            if chat_id in self._pending:
+                self._ready.append(chat_id)
+            self._dispatch()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Метрики планировщика: выполняемые и ожидающие поиски, замененные запросы.
+        """
+        return {
+            "running": len(self._running),
+            "pending": len(self._pending),
+            "started": self.started,
+            "superseded": self.superseded,
+        }
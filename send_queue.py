@@ -0,0 +1,252 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import itertools
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+# Приоритеты отправки: ответы на действия пользователя идут раньше массовых рассылок
+INTERACTIVE = 0
+BULK = 1
+
+send_priority: "contextvars.ContextVar[int]" = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+@contextlib.contextmanager
+def bulk_sends() -> Iterator[None]:
+    """
+    Помечает отправки внутри блока как массовые (например, показ истории).
+    """
+    token = send_priority.set(BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+ChatId = Union[int, str]
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше capacity.
+    Допускается уход в минус, чтобы дорогие запросы (медиагруппы) отрабатывались позже.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, cost: float, now: float) -> None:
+        self._refill(now)
+        self.tokens -= cost
+
+
+class _Pending:
+
+    __slots__ = ("priority", "seq", "chat_id", "cost", "enqueued_at", "future")
+
+    def __init__(self, priority: int, seq: int, chat_id: ChatId, cost: int, future: "asyncio.Future[None]") -> None:
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+        self.future = future
+
+
+class SendScheduler:
+    """
+    Очередь исходящих запросов к Telegram с общим и поканальным ограничением
+    частоты, паузами по retry_after и приоритетами.
+    """
+
+    # Корзины чатов, не использовавшиеся дольше этого времени, удаляются
+    IDLE_BUCKET_SECONDS = 60.0
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 10.0,
+        group_rate: float = 20 / 60,
+        group_burst: float = 5.0,
+    ) -> None:
+        """
+        :param global_rate: Сообщений в секунду на всего бота.
+        :param chat_rate: Сообщений в секунду в личный чат.
+        :param chat_burst: Допустимая пачка сообщений в личный чат.
+        :param group_rate: Сообщений в секунду в группу.
+        :param group_burst: Допустимая пачка сообщений в группу.
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[ChatId, TokenBucket] = {}
+        self._paused_until: Dict[ChatId, float] = {}
+        self._queue: List[_Pending] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+        self.sent = 0
+        self.retry_after = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate, self.group_burst) if is_group else TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _chat_wait_time(self, chat_id: ChatId, now: float) -> float:
+        paused = self._paused_until.get(chat_id, 0.0) - now
+        if paused <= 0:
+            self._paused_until.pop(chat_id, None)
+        return max(paused, self._bucket(chat_id).wait_time(now))
+
+    def pause(self, chat_id: ChatId, seconds: float) -> None:
+        """
+        Приостанавливает отправку в чат, например после ответа 429 с retry_after.
+        """
+        self.retry_after += 1
+        self._paused_until[chat_id] = max(self._paused_until.get(chat_id, 0.0), time.monotonic() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def acquire(self, chat_id: ChatId, cost: int = 1, priority: Optional[int] = None) -> None:
+        """
+        Ждет разрешения на отправку в чат.
+
+        :param chat_id: Чат получателя.
+        :param cost: Количество сообщений в запросе.
+        :param priority: INTERACTIVE или BULK; по умолчанию берется из send_priority.
+        """
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        pending = _Pending(
+            send_priority.get() if priority is None else priority,
+            next(self._seq),
+            chat_id,
+            cost,
+            asyncio.get_running_loop().create_future()
+        )
+        bisect.insort(self._queue, pending, key=lambda item: (item.priority, item.seq))
+        self._wakeup.set()
+        await pending.future
+
+    async def _run(self) -> None:
+        while True:
+            # Отмененные ожидания выбрасываются из очереди
+            self._queue = [item for item in self._queue if not item.future.done()]
+            if not self._queue:
+                self._prune(time.monotonic())
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = self._global.wait_time(now)
+            if delay <= 0:
+                for index, item in enumerate(self._queue):
+                    chat_delay = self._chat_wait_time(item.chat_id, now)
+                    if chat_delay <= 0:
+                        self._grant(index, now)
+                        delay = 0.0
+                        break
+                    delay = chat_delay if delay <= 0 else min(delay, chat_delay)
+                if delay <= 0:
+                    continue
+
+            self._wakeup.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+
+    def _grant(self, index: int, now: float) -> None:
+        item = self._queue.pop(index)
+        self._global.consume(item.cost, now)
+        self._bucket(item.chat_id).consume(item.cost, now)
+        waited = now - item.enqueued_at
+        self.sent += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        item.future.set_result(None)
+
+    def _prune(self, now: float) -> None:
+        idle = [
+            chat_id for chat_id, bucket in self._chats.items()
+            if now - bucket.updated > self.IDLE_BUCKET_SECONDS and chat_id not in self._paused_until
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Метрики очереди: глубина по приоритетам, число отправок и время ожидания.
+        """
+        return {
+            "queue_depth": len(self._queue),
+            "queue_depth_interactive": sum(1 for item in self._queue if item.priority == INTERACTIVE),
+            "queue_depth_bulk": sum(1 for item in self._queue if item.priority == BULK),
+            "sent": self.sent,
+            "retry_after": self.retry_after,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Пропускает все запросы бота, адресованные чату, через SendScheduler
+    и повторяет их после паузы при ответе 429.
+    """
+
+    def __init__(self, scheduler: SendScheduler, max_retries: int = 3) -> None:
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        media = getattr(method, "media", None)
+        cost = len(media) if isinstance(media, list) else 1
+        attempt = 0
+        while True:
+            await self.scheduler.acquire(chat_id, cost)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.scheduler.pause(chat_id, e.retry_after)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
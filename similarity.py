@@ -0,0 +1,117 @@
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from movies import Movie
+
+# Веса групп признаков: жанры определяют сходство сильнее года и рейтинга
+GENRE_WEIGHT = 1.0
+YEAR_WEIGHT = 0.5
+RATING_WEIGHT = 0.5
+
+# Признаки фильма: id, год, рейтинг IMDb, жанры
+Features = Tuple[int, Optional[int], Optional[float], Tuple[str, ...]]
+
+
+class FeatureIndex:
+    """
+    Матрица признаков фильмов: жанры (нормированный вектор), год и рейтинг
+    (стандартизованные). Строки имеют единичную длину, поэтому косинусное
+    сходство всех фильмов с профилем пользователя - одно умножение матрицы на вектор.
+    """
+
+    def __init__(self, features: List[Features], movies: Optional[Dict[int, Movie]] = None) -> None:
+        """
+        :param features: Признаки фильмов-кандидатов.
+        :param movies: Записи фильмов, если кандидаты взяты не из каталога.
+        """
+        self.movies = movies
+        self.ids = np.array([movie_id for movie_id, *_ in features], dtype=np.int64)
+        self.positions: Dict[int, int] = {movie_id: position for position, (movie_id, *_) in enumerate(features)}
+        self.genres: Dict[str, int] = {}
+        for *_, genres in features:
+            for genre in genres:
+                self.genres.setdefault(genre.casefold(), len(self.genres))
+
+        years = np.array([year if year is not None else np.nan for _, year, _, _ in features], dtype=np.float64)
+        ratings = np.array([rating if rating is not None else np.nan for _, _, rating, _ in features], dtype=np.float64)
+        self._year_scale = self._scale(years)
+        self._rating_scale = self._scale(ratings)
+
+        self.matrix = np.zeros((len(features), len(self.genres) + 2), dtype=np.float32)
+        for position, (_, _, _, genres) in enumerate(features):
+            self._fill_genres(self.matrix[position], genres)
+        self.matrix[:, -2] = self._standardize(years, self._year_scale, YEAR_WEIGHT)
+        self.matrix[:, -1] = self._standardize(ratings, self._rating_scale, RATING_WEIGHT)
+        self.matrix /= np.maximum(np.linalg.norm(self.matrix, axis=1, keepdims=True), 1e-9)
+        self.built_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _scale(values: np.ndarray) -> Tuple[float, float]:
+
+        known = values[~np.isnan(values)]
+        if not len(known):
+            return 0.0, 1.0
+        return float(known.mean()), float(known.std()) or 1.0
+
+    @staticmethod
+    def _standardize(values: np.ndarray, scale: Tuple[float, float], weight: float) -> np.ndarray:
+        """
+        Отклонение от среднего в стандартных отклонениях; неизвестные значения равны среднему.
+        """
+        mean, std = scale
+        return np.nan_to_num((values - mean) / std * weight, nan=0.0)
+
+    def _fill_genres(self, row: np.ndarray, genres: Iterable[str]) -> None:
+
+        columns = [self.genres[genre.casefold()] for genre in genres if genre.casefold() in self.genres]
+        if columns:
+            row[columns] = GENRE_WEIGHT / np.sqrt(len(columns))
+
+    def vector(self, movie_id: Optional[int], year: Optional[int], rating: Optional[float], genres: Iterable[str]) -> np.ndarray:
+        """
+        Вектор признаков фильма: строка матрицы или вектор, построенный по тем же шкалам,
+        если фильма нет среди кандидатов.
+        """
+        position = self.positions.get(movie_id) if movie_id is not None else None
+        if position is not None:
+            return self.matrix[position]
+        row = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        self._fill_genres(row, genres)
+        row[-2:] = (
+            self._standardize(np.array([np.nan if year is None else year], dtype=np.float64), self._year_scale, YEAR_WEIGHT)[0],
+            self._standardize(np.array([np.nan if rating is None else rating], dtype=np.float64), self._rating_scale, RATING_WEIGHT)[0],
+        )
+        return row / max(float(np.linalg.norm(row)), 1e-9)
+
+    def rank(self, profile: np.ndarray, exclude: Set[int], limit: int) -> List[int]:
+        """
+        Id фильмов, наиболее похожих на профиль, по убыванию косинусного сходства.
+
+        :param profile: Сумма векторов просмотренных фильмов.
+        :param exclude: Id фильмов, которые не рекомендуются (уже просмотренные).
+        :param limit: Количество фильмов.
+        """
+        norm = float(np.linalg.norm(profile))
+        if not len(self.ids) or norm == 0.0:
+            return []
+        scores = self.matrix @ (profile / norm)
+        excluded = [self.positions[movie_id] for movie_id in exclude if movie_id in self.positions]
+        scores[excluded] = -np.inf
+        limit = min(limit, len(scores) - len(excluded))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.ids[top].tolist()
+
+    def total(self, vectors: Iterable[np.ndarray]) -> np.ndarray:
+        """
+        Сумма векторов фильмов - профиль пользователя; для пустого набора нулевой вектор.
+        """
+        vectors = list(vectors)
+        return np.sum(vectors, axis=0) if vectors else np.zeros(self.matrix.shape[1], dtype=np.float32)
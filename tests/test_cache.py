@@ -0,0 +1,75 @@
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from cache import ResponseCache
+
+
+class CountingFetch:
+    """
+    Запрос к API, который отвечает заданными ответами по очереди и считает вызовы.
+    """
+
+    def __init__(self, *responses: Dict[str, Any], delay: float = 0.0) -> None:
+        self.responses: List[Dict[str, Any]] = list(responses)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> Dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.responses.pop(0)
+
+
+def test_concurrent_requests_share_one_fetch():
+    cache = ResponseCache()
+    fetch = CountingFetch({"docs": [1]}, delay=0.01)
+
+    async def search() -> List[Dict[str, Any]]:
+        return await asyncio.gather(*(
+            cache.get_or_fetch("/search", {"query": title}, fetch) for title in ("Матрица", " матрица ", "МАТРИЦА")
+        ))
+
+    assert asyncio.run(search()) == [{"docs": [1]}] * 3
+    assert fetch.calls == 1
+    assert (cache.misses, cache.hits) == (1, 2)
+    assert not cache._inflight
+
+
+def test_error_is_not_cached():
+    cache = ResponseCache()
+    fetch = CountingFetch({"error": "Ошибка запроса к API"}, {"docs": [1]})
+    assert "error" in asyncio.run(cache.get_or_fetch("", {"page": 1}, fetch))
+    assert asyncio.run(cache.get_or_fetch("", {"page": 1}, fetch)) == {"docs": [1]}
+    assert fetch.calls == 2
+
+
+def test_stale_entry_is_returned_on_error(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(db_path=path, stale_ttl=60).set(ResponseCache.make_key("", {"page": 1}), {"docs": [1]}, ttl=-1)
+
+    # После перезапуска устаревшая запись есть только на диске
+    cache = ResponseCache(db_path=path, stale_ttl=60)
+    fetch = CountingFetch({"error": "Ошибка запроса к API"})
+    assert asyncio.run(cache.get_or_fetch("", {"page": 1}, fetch)) == {"docs": [1]}
+    assert (fetch.calls, cache.stale_hits) == (1, 1)
+
+
+def test_stale_entry_expires_after_stale_ttl():
+    cache = ResponseCache(stale_ttl=60)
+    key = cache.make_key("", {"page": 1})
+    cache.set(key, {"docs": [1]}, ttl=-120)
+
+    fetch = CountingFetch({"error": "Ошибка запроса к API"})
+    assert "error" in asyncio.run(cache.get_or_fetch("", {"page": 1}, fetch))
+    assert cache.stale_hits == 0
+
+
+def test_preload_reads_fresh_entries_from_disk(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(db_path=path).set("fresh", {"docs": [1]}, ttl=60)
+
+    cache = ResponseCache(db_path=path)
+    assert cache.preload() == 1
+    assert cache.get("fresh") == {"docs": [1]}
+    assert cache._entries["fresh"][0] > time.time()
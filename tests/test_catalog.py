@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+import pytest
+
+from catalog import Catalog
+
+DUMP_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "catalog_dump.json")
+
+
+@pytest.fixture
+def dump() -> List[Dict[str, Any]]:
+    with open(DUMP_PATH, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    return str(tmp_path / "catalog.db")
+
+
+def ids(response: Dict[str, Any]) -> List[int]:
+    return [movie.id for movie in response["docs"]]
+
+
+class FakeApi:
+    """
+    Отдает страницы записанного дампа вместо /movie и может сбоить на заданной странице.
+    """
+
+    def __init__(self, pages: List[Dict[str, Any]], fail_on: int = 0) -> None:
+        self.pages = pages
+        self.fail_on = fail_on
+        self.requests: List[Dict[str, Any]] = []
+
+    async def __call__(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.requests.append(params)
+        if params["page"] == self.fail_on:
+            return {"error": "Ошибка запроса к API"}
+        return self.pages[params["page"] - 1]
+
+
+def test_load_dump_and_search(db_path, dump):
+    catalog = Catalog(db_path)
+    assert catalog.load_dump(DUMP_PATH) == 6
+    assert len(catalog) == 6
+    assert catalog.is_ready()
+
+    assert ids(catalog.search(genre="Фантастика ", limit=10)) == [301, 304, 305, 306]
+    assert ids(catalog.search(rating=(8.5, 10), limit=10)) == [301, 304]
+    assert ids(catalog.search(year=(1970, 1980), genre="драма", limit=10)) == [306]
+    assert ids(catalog.search(budget=(0, 10_000_000), limit=10)) == [302, 306]
+
+    first = catalog.search(genre="фантастика", page=1, limit=3)
+    second = catalog.search(genre="фантастика", page=2, limit=3)
+    assert (ids(first), first["pages"]) == ([301, 304, 305], 2)
+    assert (ids(second), second["pages"]) == ([306], 2)
+    assert catalog.search(genre="вестерн")["docs"] == []
+
+
+def test_full_sync_resumes_from_checkpoint(db_path, dump):
+    catalog = Catalog(db_path)
+    with pytest.raises(RuntimeError):
+        asyncio.run(catalog.sync(FakeApi(dump, fail_on=2), full=True))
+    assert catalog.get_meta("full_sync_page") == "1"
+    assert len(catalog) == 3
+    assert not catalog.is_ready()
+
+    api = FakeApi(dump)
+    assert asyncio.run(catalog.sync(api, full=True)) == 3
+    assert [params["page"] for params in api.requests] == [2]
+    assert catalog.get_meta("full_sync_page") is None
+    assert len(catalog) == 6
+    assert catalog.is_ready()
+
+
+def test_full_sync_respects_max_pages(db_path, dump):
+    catalog = Catalog(db_path)
+    assert asyncio.run(catalog.sync(FakeApi(dump), full=True, max_pages=1)) == 3
+    assert catalog.get_meta("full_sync_page") == "1"
+    assert not catalog.is_ready()
+
+
+def test_incremental_sync_requests_changes_since_last_sync(db_path, dump):
+    catalog = Catalog(db_path)
+    catalog.load_dump(DUMP_PATH)
+    api = FakeApi([{**dump[1], "pages": 1}])
+    asyncio.run(catalog.sync(api))
+    assert "updatedAt" in api.requests[0]
+    assert api.requests[0]["page"] == 1
+
+
+def test_sees_sync_from_another_process(db_path, dump):
+    catalog = Catalog(db_path)
+    revision = catalog.revision
+    assert not catalog.is_ready()
+
+    # Синхронизация по cron работает с тем же файлом через свое соединение
+    Catalog(db_path).load_dump(DUMP_PATH)
+    catalog.refresh_interval = 0.0
+    assert catalog.is_ready()
+    assert len(catalog) == 6
+    assert catalog.revision != revision
+
+
+def test_stale_catalog_is_not_ready(db_path, dump):
+    catalog = Catalog(db_path)
+    catalog.load_dump(DUMP_PATH)
+    catalog.mark_synced(time.time() - 10 * 365 * 24 * 3600)
+    assert not catalog.is_ready()
+
+
+def test_upsert_replaces_genres(db_path, dump):
+    catalog = Catalog(db_path)
+    catalog.load_dump(DUMP_PATH)
+    matrix = {**dump[0]["docs"][0], "genres": [{"name": "триллер"}], "year": 2000}
+    assert catalog.upsert([matrix]) == 1
+
+    assert len(catalog) == 6
+    assert ids(catalog.search(genre="триллер", limit=10)) == [301]
+    assert 301 not in ids(catalog.search(genre="фантастика", limit=10))
+    assert catalog.get_many([301])[0].year == 2000
+    plan = catalog._db.execute("EXPLAIN QUERY PLAN DELETE FROM movie_genres WHERE movie_id = ?", (301,)).fetchall()
+    assert "SCAN" not in " ".join(str(row[-1]) for row in plan)
@@ -0,0 +1,60 @@
+import asyncio
+import sqlite3
+import time
+
+from key_pool import KeyPool
+
+
+def test_least_used_key_and_daily_limit(tmp_path):
+    pool = KeyPool(["a", "b"], str(tmp_path / "keys.db"), daily_limit=2, sync_interval=3600)
+    assert sorted(pool.acquire() for _ in range(4)) == ["a", "a", "b", "b"]
+    assert pool.acquire() is None
+    assert pool.stats() == {"keys": 2, "available": 0, "used_today": 4}
+    pool.close()
+
+
+def test_rejected_key_is_paused(tmp_path):
+    pool = KeyPool(["a", "b"], str(tmp_path / "keys.db"), sync_interval=3600)
+    pool.report("a", 429, {}, retry_after=60)
+    pool.report("b", 200, {"X-RateLimit-Remaining": "0"})
+    assert pool.acquire() is None
+    pool.close()
+
+
+def test_processes_share_counters_through_sync(tmp_path):
+    path = str(tmp_path / "keys.db")
+    first = KeyPool(["a"], path, daily_limit=3, sync_interval=3600)
+    second = KeyPool(["a"], path, daily_limit=3, sync_interval=3600)
+    assert first.acquire() == "a"
+    assert first.acquire() == "a"
+    first.report("a", 429, {}, retry_after=60)
+    first.sync()
+
+    second.sync()
+    assert second.stats()["used_today"] == 2
+    assert second.acquire() is None
+    first.close()
+    second.close()
+
+
+def test_locked_database_does_not_block_acquire(tmp_path):
+    path = str(tmp_path / "keys.db")
+    pool = KeyPool(["a"], path, sync_interval=0)
+    # Другой процесс держит блокировку записи дольше таймаута ожидания
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def acquire_many() -> float:
+        started = time.perf_counter()
+        for _ in range(50):
+            assert pool.acquire() == "a"
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - started
+        other.execute("ROLLBACK")
+        while pool._sync_task is not None:
+            await asyncio.sleep(0.05)
+        return elapsed
+
+    assert asyncio.run(acquire_many()) < 0.5
+    pool.close()
+    assert sqlite3.connect(path).execute("SELECT used FROM api_keys").fetchone()[0] == 50
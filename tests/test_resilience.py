@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+import kinopoisk_api
+from resilience import CircuitBreaker
+
+
+def open_breaker(**kwargs) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, **kwargs)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats() == {"open": 1, "opened": 1, "rejected": 1}
+
+
+def test_half_open_lets_one_probe_and_closes_on_success():
+    breaker = open_breaker(reset_timeout=0, probe_timeout=60)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.probing
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker(reset_timeout=0, probe_timeout=60)
+    assert breaker.allow()
+    breaker.reset_timeout = 60
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+    assert not breaker.allow()
+
+
+def test_lost_probe_is_replaced_after_probe_timeout():
+    breaker = open_breaker(reset_timeout=0, probe_timeout=60)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.probe_timeout = 0
+    assert breaker.allow()
+
+
+def test_released_probe_lets_next_request_through():
+    breaker = open_breaker(reset_timeout=0, probe_timeout=60)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert not breaker.probing
+    assert breaker.allow()
+
+
+class NoKeys:
+
+    def acquire(self) -> None:
+        return None
+
+
+class OneKey:
+
+    def acquire(self) -> str:
+        return "key"
+
+
+class HangingSession:
+    """
+    Сессия, запрос через которую не завершается, пока его не отменят.
+    """
+
+    def __init__(self) -> None:
+        self.started = asyncio.Event()
+
+    def get(self, *args, **kwargs) -> "HangingSession":
+        return self
+
+    async def __aenter__(self) -> None:
+        self.started.set()
+        await asyncio.Event().wait()
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+
+@pytest.fixture
+def probing_breaker(monkeypatch) -> CircuitBreaker:
+    breaker = open_breaker(reset_timeout=0, probe_timeout=60)
+    monkeypatch.setattr(kinopoisk_api, "breaker", breaker)
+    return breaker
+
+
+def test_fetch_without_key_releases_probe(monkeypatch, probing_breaker):
+    monkeypatch.setattr(kinopoisk_api, "get_key_pool", NoKeys)
+    result = asyncio.run(kinopoisk_api._fetch("", {"page": 1}))
+    assert "error" in result
+    assert probing_breaker.state == CircuitBreaker.HALF_OPEN
+    assert not probing_breaker.probing
+    assert probing_breaker.allow()
+
+
+def test_cancelled_fetch_releases_probe(monkeypatch, probing_breaker):
+    session = HangingSession()
+    monkeypatch.setattr(kinopoisk_api, "get_key_pool", OneKey)
+    monkeypatch.setattr(kinopoisk_api, "get_session", lambda: session)
+
+    async def cancel_probe() -> None:
+        task = asyncio.create_task(kinopoisk_api._fetch("", {"page": 1}))
+        await session.started.wait()
+        assert probing_breaker.probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert not probing_breaker.probing
+    assert probing_breaker.allow()
@@ -0,0 +1,151 @@
+import asyncio
+import re
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from config import TITLE_INDEX_MAX_MOVIES, TITLE_MATCH_THRESHOLD
+from movies import Movie
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_title(title: str) -> str:
+    """
+    Приводит название к виду для сравнения: нижний регистр, ё -> е,
+    знаки препинания заменяются пробелами.
+    """
+    title = title.casefold().replace("ё", "е").replace("_", " ")
+    return " ".join(_NON_WORD.sub(" ", title).split())
+
+
+def trigrams(title: str) -> FrozenSet[str]:
+    """
+    Символьные триграммы нормализованного названия, каждое слово дополняется пробелами
+    по краям, чтобы совпадения начала и конца слова весили больше.
+    """
+    grams: Set[str] = set()
+    for word in normalize_title(title).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class TitleIndex:
+    """
+    Индекс названий уже встречавшихся фильмов по символьным триграммам для
+    нечеткого поиска с опечатками. Хранит не больше max_movies фильмов,
+    вытесняя давно добавленные.
+    """
+
+    def __init__(self, max_movies: int = 50000, threshold: float = 0.5) -> None:
+        """
+        :param max_movies: Максимальное количество фильмов в индексе.
+        :param threshold: Минимальная похожесть (коэффициент Дайса), при которой фильм считается найденным.
+        """
+        self.max_movies = max_movies
+        self.threshold = threshold
+        self.loaded = False
+        self._movies: "OrderedDict[int, Tuple[Movie, FrozenSet[str]]]" = OrderedDict()
+        self._postings: Dict[str, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._movies)
+
+    def add(self, movie: Movie) -> None:
+        """
+        Добавляет фильм или обновляет его запись.
+        """
+        movie_id = movie.id
+        if movie_id is None or not movie.name:
+            return
+        self._remove(movie_id)
+        grams = trigrams(movie.name)
+        if movie.alternative_name:
+            grams |= trigrams(movie.alternative_name)
+        self._movies[movie_id] = (movie, grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(movie_id)
+        while len(self._movies) > self.max_movies:
+            self._remove(next(iter(self._movies)))
+
+    def add_many(self, movies: Iterable[Movie]) -> None:
+
+        for movie in movies:
+            self.add(movie)
+
+    def _remove(self, movie_id: int) -> None:
+
+        entry = self._movies.pop(movie_id, None)
+        if entry is None:
+            return
+        for gram in entry[1]:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(movie_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, title: str, limit: Optional[int] = None) -> List[Tuple[float, Movie]]:
+        """
+        Ищет фильмы с похожим названием.
+
+        :param title: Запрос пользователя.
+        :param limit: Максимальное количество результатов.
+        :return: Пары (похожесть, фильм) по убыванию похожести.
+        """
+        query = trigrams(title)
+        if not query:
+            return []
+        shared: Dict[int, int] = {}
+        for gram in query:
+            for movie_id in self._postings.get(gram, ()):
+                shared[movie_id] = shared.get(movie_id, 0) + 1
+
+        matches = []
+        for movie_id, count in shared.items():
+            movie, grams = self._movies[movie_id]
+            score = 2 * count / (len(query) + len(grams))
+            if score >= self.threshold:
+                matches.append((score, movie))
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return matches[:limit] if limit is not None else matches
+
+    def load_from_history(self) -> None:
+        """
+        Однократно заполняет индекс фильмами из истории запросов.
+        """
+        if self.loaded:
+            return
+        from history_manager import get_seen_movies
+
+        # Старые записи добавляются первыми, чтобы при переполнении вытеснялись они
+        for entry in reversed(get_seen_movies(self.max_movies)):
+            self.add(Movie.from_history_entry(entry))
+        self.loaded = True
+
+    async def load_in_background(self, chunk_size: int = 100) -> None:
+        """
+        Заполняет индекс из истории при прогреве, не занимая цикл событий: история
+        читается в рабочем потоке, фильмы добавляются частями с передачей управления.
+        """
+        if self.loaded:
+            return
+        from history_manager import read_seen_movies
+
+        def read() -> List[Movie]:
+            return [Movie.from_history_entry(entry) for entry in reversed(read_seen_movies(self.max_movies))]
+
+        movies = await asyncio.to_thread(read)
+        for start in range(0, len(movies), chunk_size):
+            # Поиск мог уже заполнить индекс синхронно, пока шел прогрев
+            if self.loaded:
+                return
+            for movie in movies[start:start + chunk_size]:
+                # Фильмы из ответов API, пришедших за время прогрева, свежее записей истории
+                if movie.id not in self._movies:
+                    self.add(movie)
+            await asyncio.sleep(0)
+        self.loaded = True
+
+
+title_index = TitleIndex(max_movies=TITLE_INDEX_MAX_MOVIES, threshold=TITLE_MATCH_THRESHOLD)
@@ -0,0 +1,236 @@
+"""
+Запуск бота в режиме webhook на веб-сервере aiohttp.
+
+    python webhook.py                        # один процесс
+    python webhook.py --workers 4            # четыре процесса на одном порту (SO_REUSEPORT)
+    python webhook.py --dry-run              # без обращений к Telegram, запросы бота пишутся в лог
+    python webhook.py --replay updates.json  # отправить записанные Update на запущенный webhook
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+from datetime import datetime
+from typing import Any, List, Optional
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import Chat, Message, User
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from metrics import start_metrics_server
+
+from config import (
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_WORKERS,
+    WEBHOOK_MAX_IN_FLIGHT,
+    WEBHOOK_SHUTDOWN_TIMEOUT,
+    METRICS_HOST,
+    METRICS_PORT,
+    LOG_LEVEL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик webhook с ограничением числа одновременно обрабатываемых обновлений.
+    Сверх лимита отвечает 503, и Telegram (или балансировщик) повторяет доставку позже.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_in_flight: int, **kwargs: Any) -> None:
+        # Ответ отправляется после обработки, иначе число обновлений в работе не ограничить
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=False, **kwargs)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+
+        if self.in_flight >= self.max_in_flight:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        self.in_flight += 1
+        try:
+            return await super().handle(request)
+        finally:
+            self.in_flight -= 1
+
+
+class DryRunMiddleware(BaseRequestMiddleware):
+    """
+    Не отправляет запросы в Telegram: пишет их в лог и возвращает заглушки,
+    чтобы обработчики можно было проверять на записанных обновлениях.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        logger.info("dry-run %s %s", method.__api_method__, method.model_dump(exclude_none=True, warnings=False))
+        chat_id = getattr(method, "chat_id", None)
+        message = Message(
+            message_id=0,
+            date=datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type="private")
+        )
+        returning = method.__returning__
+        if returning is Message:
+            result: Any = message
+        elif returning == List[Message]:
+            result = [message for _ in getattr(method, "media", [])]
+        elif returning is User:
+            result = User(id=0, is_bot=True, first_name="dry-run")
+        else:
+            result = True
+        return Response[returning](ok=True, result=result)
+
+
+def create_app(worker_index: int = 0, dry_run: bool = False) -> web.Application:
+    """
+    Создает приложение aiohttp с маршрутом webhook.
+
+    :param worker_index: Номер процесса; webhook в Telegram регистрирует только процесс 0.
+    :param dry_run: Не обращаться к Telegram.
+    """
+    # Бот импортируется в каждом процессе отдельно: соединения с базами не должны переживать fork
+    from bot import bot, dp
+
+    if dry_run:
+        bot.session.middleware(DryRunMiddleware())
+
+    app = web.Application()
+    BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_in_flight=WEBHOOK_MAX_IN_FLIGHT,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    if worker_index == 0 and WEBHOOK_URL and not dry_run:
+        async def on_startup(_: web.Application) -> None:
+            await bot.set_webhook(
+                f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET or None,
+            )
+        app.on_startup.append(on_startup)
+
+    if METRICS_PORT:
+        # Каждый процесс публикует свои метрики на отдельном порту: METRICS_PORT + номер процесса
+        async def start_metrics(app: web.Application) -> None:
+            app["metrics_runner"] = await start_metrics_server(METRICS_HOST, METRICS_PORT + worker_index)
+
+        async def stop_metrics(app: web.Application) -> None:
+            await app["metrics_runner"].cleanup()
+
+        app.on_startup.append(start_metrics)
+        app.on_cleanup.append(stop_metrics)
+    return app
+
+
+def run_worker(worker_index: int, dry_run: bool) -> None:
+
+    logging.basicConfig(level=logging.INFO if dry_run else LOG_LEVEL)
+    # reuse_port позволяет нескольким процессам слушать один порт, ядро распределяет соединения
+    web.run_app(
+        create_app(worker_index, dry_run),
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        reuse_port=True,
+        shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT,
+    )
+
+
+def _run_child_worker(worker_index: int, dry_run: bool) -> None:
+
+    # Своя группа процессов: Ctrl+C в терминале получает только родитель и пересылает его один раз
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    run_worker(worker_index, dry_run)
+
+
+def serve(workers: int, dry_run: bool) -> None:
+    """
+    Запускает workers процессов webhook и ждет их завершения. SIGTERM и SIGINT
+    родителя пересылаются процессам как SIGTERM, и каждый из них штатно завершает
+    работу: дожидается текущих обновлений и записывает историю.
+    """
+    if workers == 1:
+        run_worker(0, dry_run)
+        return
+    # Процессы импортируют config заново: общие на бота лимиты делятся между ними
+    os.environ["BOT_PROCESSES"] = str(workers)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_run_child_worker, args=(index, dry_run), name=f"webhook-{index}")
+        for index in range(workers)
+    ]
+
+    stopping = False
+
+    def stop(signum: int, _: Any) -> None:
+        nonlocal stopping
+        stopping = True
+        logger.info("Получен сигнал %s, процессы webhook останавливаются", signum)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        if stopping:
+            break
+        process.start()
+    for process in processes:
+        if process.pid is not None:
+            process.join()
+
+
+async def replay(path: str, url: Optional[str] = None) -> None:
+    """
+    Отправляет на webhook записанные обновления из JSON-файла (объект или список объектов).
+    """
+    url = url or f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+    with open(path, "r", encoding="utf-8") as file:
+        updates = json.load(file)
+    if isinstance(updates, dict):
+        updates = [updates]
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for update in updates:
+            async with session.post(url, json=update) as response:
+                print(f"update {update.get('update_id')}: {response.status}")
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Запуск бота в режиме webhook")
+    parser.add_argument("--workers", type=int, default=WEBHOOK_WORKERS, help="количество процессов")
+    parser.add_argument("--dry-run", action="store_true", help="не обращаться к Telegram")
+    parser.add_argument("--replay", metavar="FILE", help="отправить записанные обновления на webhook")
+    parser.add_argument("--url", help="адрес webhook для --replay")
+    args = parser.parse_args()
+
+    if args.replay:
+        asyncio.run(replay(args.replay, args.url))
+    else:
+        serve(args.workers, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()